@@ -0,0 +1,51 @@
+"""
+Per-call latency of common db helpers: a new connection per call (the code before the
+per-thread connection layer) against the long-lived WAL connections. The identity and karma
+caches are disabled so every call reaches SQLite.
+
+    python bench/bench_db.py [--baseline REV] [-n CALLS]
+"""
+import argparse
+
+from common import load_at, per_call_us, report, temp_db
+
+# the last revision that opened a connection per call
+BASELINE = "510e308"
+
+
+def calls(module):
+    return [
+        ("get_karma", lambda i: module.get_karma(1, i % 50)),
+        ("get_name", lambda i: module.get_name(i % 50)),
+        ("update_usage", lambda i: module.update_usage(i % 50, 0.0001)),
+        ("add_reaction", lambda i: module.add_reaction(i, i % 50, 7, "🔥")),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("-n", type=int, default=2000)
+    args = parser.parse_args()
+
+    db = temp_db()
+    db.karma_cache.maxsize = 0
+    db.identity_cache.maxsize = 0
+    after = {name: per_call_us(func, args.n) for name, func in calls(db)}
+
+    # the baseline's own init_db deadlocks on a fresh file, so the current one creates the schema
+    db = temp_db()
+    db.close_connections()
+    old = load_at(args.baseline, "db.py", "db_baseline")
+    old.DB_PATH = db.DB_PATH
+    before = {name: per_call_us(func, args.n) for name, func in calls(old)}
+
+    lines = [f"{args.n} calls each, temp database, per-call latency",
+             f"{'call':<14}{'before us':>12}{'after us':>12}"]
+    lines += [f"{name:<14}{before[name]:>12.1f}{after[name]:>12.1f}" for name in after]
+    report("db helpers: connection per call vs per-thread connections", lines)
+    db.shutdown()
+
+
+if __name__ == "__main__":
+    main()
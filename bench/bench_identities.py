@@ -0,0 +1,82 @@
+"""
+Resolving the authors of a prompt chain: one get_name/get_description pair per message and a
+set_name per unknown member (the code before bulk resolution, with no identity cache) against
+get_author_information's single get_identities lookup and set_names write.
+
+    python bench/bench_identities.py
+"""
+import asyncio
+
+from common import report, temp_db
+
+KNOWN = range(1000, 1100)
+
+
+class Member:
+    def __init__(self, user_id):
+        self.nick = None
+        self.display_name = f"member{user_id}"
+
+
+class Guild:
+    id = 5
+
+    def get_member(self, user_id):
+        return Member(user_id)
+
+
+async def per_message(db, author_ids, guild):
+    info = {}
+    for author in author_ids:
+        name = await db.run_read(db.get_name, int(author))
+        if name:
+            info[author] = (name, await db.run_read(db.get_description, int(author)))
+        else:
+            name = guild.get_member(author).display_name
+            await db.run_write(db.set_name, author, name)
+            info[author] = (name, "")
+    return info
+
+
+def reset(db):
+    db.drop_table("identities")
+    db.init_db(1)
+    for user_id in KNOWN:
+        db.set_name(user_id, f"user{user_id}")
+        db.set_description(user_id, f"desc{user_id}")
+    db.identity_cache.invalidate()
+
+
+async def timed(func, *args):
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    await func(*args)
+    return (loop.time() - start) * 1000
+
+
+async def main(db, talk):
+    lines = ["about 20% of authors are new members; times in ms",
+             f"{'msgs':>5}{'authors':>9}{'old':>10}{'new cold':>10}{'new warm':>10}"]
+    for n in (5, 50, 500):
+        ids = [(1000 + k % 100) if k % 5 else (5000 + n * 10 + k % 50) for k in range(n)]
+        ids = [ids[k % max(1, n // 3)] for k in range(n)]
+
+        reset(db)
+        db.identity_cache.maxsize = 0
+        old = await timed(per_message, db, ids, Guild())
+        db.identity_cache.maxsize = db.IDENTITY_CACHE_SIZE
+
+        reset(db)
+        cold = await timed(talk.get_author_information, ids, Guild())
+        warm = await timed(talk.get_author_information, ids, Guild())
+        lines.append(f"{n:>5}{len(set(ids)):>9}{old:>10.2f}{cold:>10.2f}{warm:>10.2f}")
+    report("prompt chain author resolution", lines)
+
+
+if __name__ == "__main__":
+    db = temp_db()
+    import talk
+    # get_author_information prints the ids it was given
+    talk.print = lambda *args, **kwargs: None
+    asyncio.run(main(db, talk))
+    db.shutdown()
@@ -0,0 +1,70 @@
+"""
+Scanning chat messages for alarming phrases: lowercasing and one substring test per phrase
+(the code before PhraseMatcher) against PhraseMatcher.search and find_all, on 20k synthetic
+messages with and without 480 extra phrases. Also times get_karma through karma_cache.
+
+    python bench/bench_matcher.py
+"""
+import random
+
+from common import best_of, per_call_us, report, temp_db
+from matcher import PhraseMatcher
+from safety import ALARMING_WORDS
+
+VOCAB = ("the a to i you it lol that is and of what my in this for just like no yeah so me have be was but "
+         "not do are on with he if can get they lmao game going gonna want think know good time one all bro "
+         "really people why would kill die end life hope myself sleep work tomorrow dude wait ok okay fr").split()
+
+
+def corpus(rng, size=20000):
+    messages = []
+    for _ in range(size):
+        text = " ".join(rng.choice(VOCAB) for _ in range(rng.choice([1, 2, 3, 5, 8, 12, 20, 40, 80])))
+        if rng.random() < 0.2:
+            text = text.capitalize() + "!"
+        if rng.random() < 0.002:
+            text += " " + rng.choice(ALARMING_WORDS).upper()
+        messages.append(text)
+    return messages
+
+
+def main():
+    rng = random.Random(0)
+    messages = corpus(rng)
+    extra = [" ".join(rng.choice(VOCAB + ["zz", "qq", "xx"]) for _ in range(3)) + f" {i}x" for i in range(480)]
+    lines = [f"{len(messages)} messages, {sum(map(len, messages)) / len(messages):.0f} chars on average; us per message",
+             f"{'phrases':>8}{'any(in)':>10}{'find_all':>10}{'search':>10}  hits"]
+    for words in (ALARMING_WORDS, ALARMING_WORDS + extra):
+        matcher = PhraseMatcher(words)
+        def substrings(text, words=words):
+            lower = text.lower()
+            return any(word in lower for word in words)
+
+        scans = {
+            "any(in)": substrings,
+            "find_all": lambda text: bool(matcher.find_all(text)),
+            "search": lambda text: matcher.search(text) is not None,
+        }
+        timings, hits = {}, set()
+        for name, scan in scans.items():
+            seconds, found = best_of(lambda: [scan(text) for text in messages], repeat=3)
+            timings[name] = seconds / len(messages) * 1e6
+            hits.add(sum(found))
+        assert len(hits) == 1, "the scans disagree"
+        lines.append(f"{len(words):>8}" + "".join(f"{timings[name]:>10.2f}" for name in scans) + f"  {hits.pop()}")
+    report("alarming phrase scan", lines)
+
+    db = temp_db()
+    for user_id in range(50):
+        db.update_karma(1, user_id, user_id)
+    cached = per_call_us(lambda i: db.get_karma(1, i % 50), 20000)
+    db.karma_cache.maxsize = 0
+    db.karma_cache.invalidate()
+    uncached = per_call_us(lambda i: db.get_karma(1, i % 50), 20000)
+    report("get_karma through karma_cache", [f"uncached {uncached:.2f}us, cached {cached:.2f}us per call",
+                                             f"cache after both runs: {db.karma_cache.stats()}"])
+    db.shutdown()
+
+
+if __name__ == "__main__":
+    main()
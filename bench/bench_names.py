@@ -0,0 +1,63 @@
+"""
+Replacing user ids with names in prompt lines: one str.replace per line per author_ids entry
+(the code before compile_id_pattern) against one compiled alternation and one sub per line.
+Both must produce the same lines.
+
+    python bench/bench_names.py
+"""
+import random
+
+from common import best_of, report
+from talk import compile_id_pattern
+
+LINES = 500
+AUTHORS = 50
+
+
+def chain(rng):
+    authors = [rng.randrange(10**17, 10**19) for _ in range(AUTHORS)]
+    bot_id = 10**18 + 7
+    info = {author: (f"Name{i}", "") for i, author in enumerate(authors)}
+    info[bot_id] = ("Bot", "")
+    lines, author_ids = [], [bot_id]
+    for i in range(LINES):
+        author = rng.choice(authors)
+        mentions = rng.sample(authors, rng.choice((0, 0, 0, 1, 2)))
+        text = f"(Oct 18 08:{i % 60:02d}) {author}: " + " ".join(["some words here"] * 5 + [f"<@{m}>" for m in mentions])
+        lines.append(["user", text, []])
+        author_ids.append(author)
+        author_ids.extend(mentions)
+    return lines, author_ids, info
+
+
+def nested_replace(lines, author_ids, info):
+    for line in lines:
+        for user_id in author_ids:
+            if str(user_id) in line[1]:
+                line[1] = line[1].replace(str(user_id), info[user_id][0])
+    return lines
+
+
+def one_pass(lines, author_ids, info):
+    names = {str(author_id): name for author_id, (name, _) in info.items()}
+    pattern = compile_id_pattern(names)
+    for line in lines:
+        line[1] = pattern.sub(lambda match: names[match.group()], line[1])
+    return lines
+
+
+def main():
+    lines, author_ids, info = chain(random.Random(1))
+    results = {}
+    for func in (nested_replace, one_pass):
+        results[func.__name__] = best_of(lambda: func([list(line) for line in lines], author_ids, info))
+    (old, old_lines), (new, new_lines) = results.values()
+    assert old_lines == new_lines, "the substitutions disagree"
+    report("id to name substitution", [
+        f"{LINES} lines, {AUTHORS} authors, {len(author_ids)} author_ids entries",
+        f"nested str.replace {old * 1000:.2f}ms, compiled alternation {new * 1000:.2f}ms",
+    ])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Memory per fetch cache entry: a discord.Message parsed from a realistic REST payload against
+the MessageRecord made from it, measured with tracemalloc over 5000 messages. Also times
+MessageRecord.from_message.
+
+    python bench/bench_records.py
+"""
+import asyncio
+import gc
+import timeit
+import tracemalloc
+
+import discord
+
+from common import report
+from discord_helper import MessageRecord
+
+N = 5000
+LONG = "message number {i} with some typical chat text about the thing we were discussing " * 2
+SHORT = "message {i}"
+
+
+def setup():
+    client = discord.Client(intents=discord.Intents.all())
+    state = client._connection
+    guild = discord.Guild(data={"id": "1", "name": "g", "channels": [], "roles": [], "members": []}, state=state)
+    state._add_guild(guild)
+    channel = discord.TextChannel(state=state, guild=guild, data={"id": "2", "type": 0, "name": "c", "position": 0})
+    return client, state, channel
+
+
+def payload(i, content):
+    author = {"id": str(1000 + i % 50), "username": f"user{i % 50}", "discriminator": "0", "avatar": None,
+              "global_name": f"User {i % 50}"}
+    data = {
+        "id": str(10**18 + i), "channel_id": "2", "guild_id": "1", "type": 19 if i else 0, "author": author,
+        "member": {"roles": [], "joined_at": "2024-01-01T00:00:00+00:00", "deaf": False, "mute": False, "nick": None},
+        "content": content.format(i=i), "timestamp": "2026-10-18T08:00:00+00:00", "edited_timestamp": None,
+        "tts": False, "mention_everyone": False, "mentions": [], "mention_roles": [], "pinned": False,
+        "attachments": [{"id": str(5 + i), "filename": "a.png", "size": 1000,
+                         "url": f"https://cdn.discordapp.com/attachments/2/{i}/a.png",
+                         "proxy_url": f"https://media.discordapp.net/attachments/2/{i}/a.png"}] if i % 5 == 0 else [],
+        "embeds": [],
+        "reactions": [{"count": 1, "me": False, "emoji": {"id": None, "name": "👍"}}] if i % 7 == 0 else [],
+    }
+    if i:
+        data["message_reference"] = {"message_id": str(10**18 + i - 1), "channel_id": "2", "guild_id": "1"}
+    return data
+
+
+def bytes_per_entry(build):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    # the payloads are garbage afterwards unless the built object keeps parts of them
+    entries = [build(i) for i in range(N)]
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del entries
+    return (after - before) / N
+
+
+async def main():
+    client, state, channel = setup()
+    lines = [f"tracemalloc, {N} messages, discord.py {discord.__version__}; bytes per entry",
+             f"{'content':>8}{'Message':>10}{'Record':>10}{'ratio':>8}"]
+    for label, content in (("typical", LONG), ("short", SHORT)):
+        message = bytes_per_entry(lambda i: discord.Message(state=state, channel=channel, data=payload(i, content)))
+        record = bytes_per_entry(lambda i: MessageRecord.from_message(
+            discord.Message(state=state, channel=channel, data=payload(i, content))))
+        lines.append(f"{label:>8}{message:>10.0f}{record:>10.0f}{message / record:>7.1f}x")
+    sample = discord.Message(state=state, channel=channel, data=payload(1, SHORT))
+    calls = 100000
+    seconds = timeit.timeit(lambda: MessageRecord.from_message(sample), number=calls)
+    lines.append(f"MessageRecord.from_message: {seconds / calls * 1e6:.2f}us")
+    report("fetch cache entry size", lines)
+    await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+"""
+Helpers shared by the micro-benchmarks in this directory. Run a benchmark from the repository
+root, e.g. `python bench/bench_db.py`; results are printed and appended to bench_output.txt.
+"""
+import importlib.util
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OUTPUT = os.path.join(ROOT, "bench_output.txt")
+
+sys.path.insert(0, ROOT)
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+
+def temp_db():
+    """
+    Point db at a fresh database in a temporary directory and create the schema.
+    """
+    import db
+    directory = tempfile.mkdtemp(prefix="bench-")
+    db.close_connections()
+    db.DB_PATH = os.path.join(directory, "bot.db")
+    db.init_db(1)
+    return db
+
+
+def load_at(revision, path, name):
+    """
+    Import path as it was at a git revision, as module name, to compare against the current code.
+    """
+    source = subprocess.run(["git", "-C", ROOT, "show", f"{revision}:{path}"],
+                            check=True, capture_output=True, text=True).stdout
+    spec = importlib.util.spec_from_loader(name, loader=None)
+    module = importlib.util.module_from_spec(spec)
+    exec(compile(source, f"{revision}:{path}", "exec"), module.__dict__)
+    return module
+
+
+def per_call_us(func, n):
+    """
+    Mean microseconds per call of func(i) for i in range(n).
+    """
+    start = time.perf_counter()
+    for i in range(n):
+        func(i)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def best_of(func, repeat=5):
+    """
+    Fastest of repeat runs of func(), in seconds, and the last result.
+    """
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def report(title, lines):
+    text = "\n".join([f"== {title} ({time.strftime('%Y-%m-%d %H:%M:%S')})", *lines, ""])
+    print(text)
+    with open(OUTPUT, "a") as f:
+        f.write(text + "\n")
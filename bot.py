@@ -1,56 +1,122 @@
+import time
+BOOT_START = time.perf_counter()
+
 import asyncio
-import datetime
 
 from discord.ext import commands
 import logging
+import pytz
 
-from discord_helper import get_msg
+from discord_helper import get_record, get_cached_record, install_message_index
 from logging_setup import setup_logging
-from config import DISCORD_TOKEN, INITIAL_DABLOONS, DO_HANDLE_ALARMING_WORDS, UPVOTE_EMOJI, DOWNVOTE_EMOJI
+from perf import message_routing
+from config import DISCORD_TOKEN, INITIAL_DABLOONS, DO_HANDLE_ALARMING_WORDS, UPVOTE_EMOJI, DOWNVOTE_EMOJI, \
+    SCHEDULER_TIMEZONE, RESPONSE_ID_TTL, DEFAULT_MODEL_ENGINE
+from context_window import get_encoder
 import os
-from db import init_db, reset_usage, get_connection, get_meta, set_meta
+import db
 import discord
 
-from db import update_karma
-from safety import ALARMING_WORDS, handle_alarming_words
+from reaction_buffer import reaction_buffer
+from safety import alarming_words, handle_alarming_words
+from scheduler import scheduler, Daily
 from talk import handle_prompt_chain
+from utils import close_http_session
+
+IMPORTS_DONE = time.perf_counter()
 
 # Set up logging
 setup_logging()
 logger = logging.getLogger(__name__)
+logger.info(f"Imported bot modules in {(IMPORTS_DONE - BOOT_START) * 1000:.0f}ms")
 
 intents = discord.Intents.default()
 intents.messages = True
 intents.message_content = True
 intents.members = True
 
-bot = commands.Bot(command_prefix=commands.when_mentioned_or("!"), intents=intents)
+class YakBot(commands.Bot):
+    async def setup_hook(self):
+        """
+        One-time initialization. Runs once after login, before the gateway connects;
+        on_ready, by contrast, fires again after every reconnect.
+        """
+        start = time.perf_counter()
+        await load_cogs()
+        cogs_done = time.perf_counter()
+        await db.ainit_db(self.user.id)
+        db_done = time.perf_counter()
+        reaction_buffer.start()
+        scheduler.start()
+        # the event loop keeps only a weak reference to tasks
+        self._warm_up_task = asyncio.create_task(warm_up())
+        logger.info(f"Setup: cogs {(cogs_done - start) * 1000:.0f}ms, database {(db_done - cogs_done) * 1000:.0f}ms")
+        await log_data_snippets()
+
+    async def close(self):
+        if getattr(self, "_warm_up_task", None) is not None:
+            self._warm_up_task.cancel()
+        await scheduler.close()
+        # commit buffered reaction writes while the event loop is still running
+        await reaction_buffer.close()
+        await close_http_session()
+        await super().close()
+
+
+COMMAND_PREFIX = "!"
+# Every message a route can apply to starts with one of these (or is a reply); see on_message
+ROUTE_PREFIXES = (COMMAND_PREFIX, "<@")
+
+bot = YakBot(command_prefix=commands.when_mentioned_or(COMMAND_PREFIX), intents=intents)
+install_message_index(bot)
 
 
 # Load all command cogs from the commands folder
 async def load_cogs():
-    for filename in os.listdir("./commands"):
+    for filename in sorted(os.listdir("./commands")):
         if filename.endswith(".py") and filename != "__init__.py":
             cog_name = filename[:-3]
+            start = time.perf_counter()
             try:
                 await bot.load_extension(f"commands.{cog_name}")
-                logger.info(f"Loaded cog: {cog_name}")
+                logger.info(f"Loaded cog: {cog_name} ({(time.perf_counter() - start) * 1000:.0f}ms)")
             except Exception as e:
                 logger.error(f"Failed to load cog {cog_name}: {e}")
 
 
+async def warm_up():
+    # Import the OpenAI client and load the token encoder in the background once connected,
+    # so the first prompt does not pay for them
+    await bot.wait_until_ready()
+    from openai_helper import get_client
+    start = time.perf_counter()
+    await asyncio.to_thread(get_client)
+    logger.info(f"OpenAI client ready in {(time.perf_counter() - start) * 1000:.0f}ms")
+    # tiktoken downloads the encoding the first time it is used
+    start = time.perf_counter()
+    await asyncio.to_thread(get_encoder, DEFAULT_MODEL_ENGINE)
+    logger.info(f"Token encoder ready in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+
+_first_ready = True
+
+
 @bot.event
 async def on_ready():
+    global _first_ready
     logger.info(f"Bot is ready. Logged in as {bot.user}")
+    if not _first_ready:
+        return
+    _first_ready = False
+    logger.info(f"Cold start: first ready {(time.perf_counter() - BOOT_START) * 1000:.0f}ms after launch")
 
-    await load_cogs()
-
-    init_db(bot.user.id)
+    for guild in bot.guilds:
+        snippet = await db.aget_karma_snippet(guild.id)
+        logger.info(f"Guild '{guild.name}' ({guild.id}) karma snippet: {snippet}")
 
-    bot.loop.create_task(background_task())
 
+async def log_data_snippets():
     from personality import static_config
-    from db import get_karma_snippet, get_usage_snippet, get_identities_snippet
 
     logger.info("Static configuration loaded:")
     if DO_HANDLE_ALARMING_WORDS:
@@ -59,14 +125,10 @@ async def on_ready():
         logger.info(f"User dict snippet: {user_dict_snippet}")
         logger.info(f"Total insults loaded: {insults_count}")
 
-    for guild in bot.guilds:
-        snippet = get_karma_snippet(guild.id)
-        logger.info(f"Guild '{guild.name}' ({guild.id}) karma snippet: {snippet}")
-
-    usage_snippet = get_usage_snippet()
+    usage_snippet = await db.aget_usage_snippet()
     logger.info(f"Usage data snippet: {usage_snippet}")
 
-    identities_snippet = get_identities_snippet()
+    identities_snippet = await db.aget_identities_snippet()
     logger.info(f"Identities data snippet: {identities_snippet}")
 
     logger.info("Data loaded successfully.")
@@ -79,102 +141,133 @@ async def on_message(message):
 
     if DO_HANDLE_ALARMING_WORDS:
         if message.guild:
-            content_lower = message.content.lower()
-            if any(word in content_lower for word in ALARMING_WORDS):
-                conn = get_connection()
-                c = conn.cursor()
-                c.execute("SELECT karma FROM karma WHERE guild_id = ? AND user_id = ?",
-                          (message.guild.id, message.author.id))
-                row = c.fetchone()
-                conn.close()
-                current_karma = row["karma"] if row else 0
+            matched = alarming_words.find_all(message.content)
+            if matched:
+                logger.info(f"Alarming words {matched} in message {message.id} from {message.author.id}")
+                current_karma = await db.aget_karma(message.guild.id, message.author.id)
                 await handle_alarming_words(message, current_karma)
 
+    start = time.perf_counter()
+    # Only prefixed messages and replies can be routed anywhere; skip parsing everything else
+    if message.reference is None and not message.content.startswith(ROUTE_PREFIXES):
+        message_routing.record("ignored", start)
+        return
+
     ctx = await bot.get_context(message)
     if ctx.valid:
+        message_routing.record("command", start)
         async with message.channel.typing():
-            return await bot.process_commands(message)
+            return await bot.invoke(ctx)
 
-    prefixes = await bot.get_prefix(message)
-    if isinstance(prefixes,str):
-        prefixes = [prefixes]
-    if any(message.content.startswith(prefix) for prefix in prefixes):
+    if ctx.prefix is not None:
+        message_routing.record("prompt", start)
         async with message.channel.typing():
             return await handle_prompt_chain(ctx, message, bot.user.id)
 
     # Special handling for messages that are replies to bot messages.
     if message.reference is not None:
-        replied_message = await get_msg(bot, message.channel, message.reference.message_id)
-        if replied_message and replied_message.author == bot.user:
+        if await get_replied_author(message) == bot.user.id:
+            message_routing.record("reply", start)
             return await handle_prompt_chain(ctx, message, bot.user.id)
 
-    await bot.process_commands(message) # do we need this?
+    message_routing.record("ignored", start)
+
+
+async def get_replied_author(message):
+    # the gateway usually resolves the reply target already; only fetch when it did not
+    resolved = message.reference.resolved
+    if isinstance(resolved, discord.Message):
+        return resolved.author.id
+    if resolved is not None:
+        # DeletedReferencedMessage
+        return None
+    record = await get_record(bot, message.channel, message.reference.message_id)
+    return record.author_id if record else None
+
+
+REACTION_VALUES = {UPVOTE_EMOJI: 1, DOWNVOTE_EMOJI: -1}
+
+
+async def get_reacted_author(payload):
+    """
+    Author of the reacted message, from the cheapest source that knows it: the add payload,
+    the buffer's recent-author index, message_scores, the message caches, and only then REST.
+    """
+    author_id = payload.message_author_id
+    source = "payload"
+    if author_id is None:
+        author_id = reaction_buffer.author_of(payload.message_id)
+        source = "index"
+    if author_id is None:
+        author_id = await db.aget_message_author(payload.message_id)
+        source = "db"
+    if author_id is None:
+        record = get_cached_record(payload.message_id)
+        source = "cache"
+        if record is None:
+            channel = bot.get_partial_messageable(payload.channel_id, guild_id=payload.guild_id)
+            record = await get_record(bot, channel, payload.message_id)
+            source = "rest"
+        if record is None:
+            return None
+        author_id = record.author_id
+    reaction_buffer.remember_author(payload.message_id, author_id)
+    reaction_buffer.author_lookups[source] += 1
+    return author_id
 
 
 @bot.event
 async def on_raw_reaction_add(payload):
+    sign = REACTION_VALUES.get(str(payload.emoji))
+    if sign is None or payload.guild_id is None:
+        return
     try:
-        channel = await bot.fetch_channel(payload.channel_id)
-        message = await get_msg(bot, channel, payload.message_id)
-        guild = bot.get_guild(payload.guild_id)
-        member = guild.get_member(payload.user_id) or await guild.fetch_member(payload.user_id)
+        author_id = await get_reacted_author(payload)
     except Exception as e:
         logger.error(f"Error in on_raw_reaction_add: {e}")
         return
+    if author_id is None:
+        logger.warning(f"Could not resolve the author of message {payload.message_id}, dropping reaction")
+        return
 
-    from db import add_reaction
-
-    if str(payload.emoji) == UPVOTE_EMOJI:
-        update_karma(guild.id, message.author.id, 1)
-        add_reaction(message.id, member.id, message.author.id, payload.emoji)
-    elif str(payload.emoji) == DOWNVOTE_EMOJI:
-        update_karma(guild.id, message.author.id, -1)
-        add_reaction(message.id, member.id, message.author.id, payload.emoji)
+    reaction_buffer.add(payload.guild_id, payload.channel_id, payload.message_id, payload.user_id, author_id,
+                        payload.emoji, sign)
 
 
 @bot.event
 async def on_raw_reaction_remove(payload):
+    sign = REACTION_VALUES.get(str(payload.emoji))
+    if sign is None or payload.guild_id is None:
+        return
     try:
-        channel = await bot.fetch_channel(payload.channel_id)
-        message = await get_msg(bot, channel, payload.message_id)
-        guild = bot.get_guild(payload.guild_id)
-        member = guild.get_member(payload.user_id) or await guild.fetch_member(payload.user_id)
+        author_id = await get_reacted_author(payload)
     except Exception as e:
         logger.error(f"Error in on_raw_reaction_remove: {e}")
         return
+    if author_id is None:
+        logger.warning(f"Could not resolve the author of message {payload.message_id}, dropping reaction removal")
+        return
 
-    from db import remove_reaction
+    reaction_buffer.remove(payload.guild_id, payload.message_id, payload.user_id, author_id, payload.emoji, -sign)
 
-    if str(payload.emoji) == UPVOTE_EMOJI:
-        update_karma(guild.id, message.author.id, -1)
-        remove_reaction(message.id, member.id, payload.emoji)
-    elif str(payload.emoji) == DOWNVOTE_EMOJI:
-        update_karma(guild.id, message.author.id, 1)
-        remove_reaction(message.id, member.id, payload.emoji)
 
+@scheduler.job("usage_reset", Daily(0, 0, pytz.timezone(SCHEDULER_TIMEZONE)))
+async def reset_daily_usage():
+    await db.areset_usage(INITIAL_DABLOONS)
+    logger.info("Usage data reset for the new day.")
 
-async def background_task():
-    await bot.wait_until_ready()
-    import pytz
-    tz = pytz.timezone('US/Eastern')
-    last_reset_str = get_meta("last_reset")
-    if last_reset_str:
-        last_reset = datetime.datetime.strptime(last_reset_str, "%Y-%m-%d").date()
-    else:
-        last_reset = datetime.datetime.now(tz).date()
-        set_meta("last_reset", last_reset.strftime("%Y-%m-%d"))
-    while not bot.is_closed():
-        now = datetime.datetime.now(tz).date()
-        if now != last_reset:
-            reset_usage(INITIAL_DABLOONS)
-            logger.info("Usage data reset for the new day.")
-            last_reset = now
-            set_meta("last_reset", last_reset.strftime("%Y-%m-%d"))
-        await asyncio.sleep(3600)
+
+@scheduler.job("response_id_prune", Daily(4, 30, pytz.timezone(SCHEDULER_TIMEZONE)), jitter=600)
+async def prune_response_ids():
+    deleted = await db.aprune_response_ids(RESPONSE_ID_TTL)
+    logger.info(f"Pruned {deleted} expired response ids")
 
 
 def run_bot():
-    bot.run(DISCORD_TOKEN)
+    try:
+        bot.run(DISCORD_TOKEN)
+    finally:
+        db.shutdown()
 
 
 if __name__ == "__main__":
@@ -4,12 +4,21 @@ import time
 import tracemalloc
 import sqlite3
 from discord.ext import commands
-from db import update_usage, reset_usage, get_connection
-from config import INITIAL_DABLOONS, ADMIN_USER_ID
+from db import adrop_table, aadd_reactions, areset_usage, aget_all_usage, aadd_bank_balance, aadd_usage_balance, \
+    aupdate_karma, aget_karma, arebuild_reaction_totals, identity_cache, karma_cache, abbreviation_cache, abackup_db, acheckpoint
+from config import INITIAL_DABLOONS, ADMIN_USER_ID, SCHEDULER_TIMEZONE, DB_BACKUP_DIR, DB_BACKUP_KEEP
+import pytz
 import json
 import os
 
-from discord_helper import get_msg
+from context_window import window_stats
+from discord_helper import get_record
+from image_cache import image_cache
+from perf import message_routing, reply_latency
+from personality import reload_static_config
+from reaction_buffer import reaction_buffer
+from safety import alarming_words, reload_alarming_words
+from scheduler import scheduler, Daily, Every
 
 logger = logging.getLogger(__name__)
 
@@ -25,16 +34,11 @@ class AdminCommands(commands.Cog):
         if not is_admin(ctx):
             await ctx.send("You do not have permission to use this command.")
             return
-        conn = get_connection()
-        c = conn.cursor()
         try:
-            c.execute(f"DROP TABLE IF EXISTS {table_name}")
-            conn.commit()
+            await adrop_table(table_name)
             await ctx.send(f"Table {table_name} has been dropped.")
         except sqlite3.Error as e:
             await ctx.send(f"Error dropping table: {e}")
-        finally:
-            conn.close()
 
 
     @commands.command(name="profilememory", help="Profile memory usage of a given command. Usage: !profilememory <command_name> [arg]")
@@ -67,9 +71,8 @@ class AdminCommands(commands.Cog):
             await ctx.send("You do not have permission to use this command.")
             return
         messages = {}
+        reactions = []
         count = 0
-        conn = get_connection()
-        c = conn.cursor()
         # Iterate through all text channels of the guild where the command was invoked.
         for channel in ctx.guild.text_channels:
             try:
@@ -82,9 +85,9 @@ class AdminCommands(commands.Cog):
                             replied_author = ""
                             if message.reference and message.reference.message_id:
                                 try:
-                                    ref_msg = await get_msg(self.bot, channel, message.reference.message_id)
+                                    ref_msg = await get_record(self.bot, channel, message.reference.message_id)
                                     replied_msg = str(ref_msg.id)
-                                    replied_author = str(ref_msg.author.id)
+                                    replied_author = str(ref_msg.author_id)
                                 except Exception:
                                     replied_msg = ""
                                     replied_author = ""
@@ -100,29 +103,18 @@ class AdminCommands(commands.Cog):
                         # Process reactions for this message
                         for reaction in message.reactions:
                             async for user in reaction.users():
-                                try:
-                                    # Insert or update reaction in DB
-                                    c.execute(
-                                        "SELECT * FROM reactions WHERE message_id = ? AND reactor_id = ? AND value = ?",
-                                        (msg_id, user.id, str(reaction.emoji)))
-                                    row = c.fetchone()
-                                    if row:
-                                        # Update reactee_id if needed
-                                        c.execute(
-                                            "UPDATE reactions SET reactee_id = ? WHERE message_id = ? AND reactor_id = ? AND value = ?",
-                                            (message.author.id, msg_id, user.id, str(reaction.emoji)))
-                                    else:
-                                        c.execute(
-                                            "INSERT INTO reactions (message_id, reactor_id, reactee_id, value) VALUES (?, ?, ?, ?)",
-                                            (msg_id, user.id, message.author.id, str(reaction.emoji)))
-                                except Exception as e:
-                                    logger.error(f"Error processing reaction: {e}")
+                                reactions.append((msg_id, channel.id, user.id, message.author.id, str(reaction.emoji)))
                     except Exception as inner_e:
                         logger.error(f"Error processing message: {inner_e}")
             except Exception as e:
                 logger.error(f"Error accessing channel {channel.name}: {e}")
-        conn.commit()
-        conn.close()
+        # Written in one transaction at the end so no transaction is held open across awaits
+        try:
+            await aadd_reactions(reactions, ctx.guild.id)
+            # re-attribute older reactions that only now learned their guild and channel
+            await arebuild_reaction_totals()
+        except Exception as e:
+            logger.error(f"Error processing reactions: {e}")
         # Write to file
         os.makedirs("data", exist_ok=True)
         with open("data/messages.json", "w", encoding="utf-8") as f:
@@ -134,7 +126,7 @@ class AdminCommands(commands.Cog):
         if not is_admin(ctx):
             await ctx.send("You do not have permission to use this command.")
             return
-        reset_usage(INITIAL_DABLOONS)
+        await areset_usage(INITIAL_DABLOONS)
         await ctx.send("Usage data has been reset.")
 
     @commands.command(name="printusage", help="Print detailed usage statistics (admin only).")
@@ -142,11 +134,7 @@ class AdminCommands(commands.Cog):
         if not is_admin(ctx):
             await ctx.send("You do not have permission to use this command.")
             return
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute("SELECT user_id, usage_balance, bank_balance, total_usage FROM usage")
-        rows = c.fetchall()
-        conn.close()
+        rows = await aget_all_usage()
         if not rows:
             await ctx.send("No usage data found.")
             return
@@ -160,18 +148,7 @@ class AdminCommands(commands.Cog):
         if not is_admin(ctx):
             await ctx.send("You do not have permission to use this command.")
             return
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute("SELECT bank_balance FROM usage WHERE user_id = ?", (user_id,))
-        row = c.fetchone()
-        if row:
-            new_bank = row["bank_balance"] + amount
-            c.execute("UPDATE usage SET bank_balance = ? WHERE user_id = ?", (new_bank, user_id))
-        else:
-            c.execute("INSERT INTO usage (user_id, usage_balance, bank_balance) VALUES (?, ?, ?)",
-                      (user_id, INITIAL_DABLOONS, amount))
-        conn.commit()
-        conn.close()
+        await aadd_bank_balance(user_id, amount)
         await ctx.send(f"Added {amount} bank dabloons to user {user_id}.")
 
     @commands.command(name="adddabloons", help="Add usage dabloons to a user (admin only). Usage: !adddabloons <user_id> <amount>")
@@ -179,18 +156,7 @@ class AdminCommands(commands.Cog):
         if not is_admin(ctx):
             await ctx.send("You do not have permission to use this command.")
             return
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute("SELECT usage_balance FROM usage WHERE user_id = ?", (user_id,))
-        row = c.fetchone()
-        if row:
-            new_usage = row["usage_balance"] + amount
-            c.execute("UPDATE usage SET usage_balance = ? WHERE user_id = ?", (new_usage, user_id))
-        else:
-            c.execute("INSERT INTO usage (user_id, usage_balance, bank_balance) VALUES (?, ?, ?)",
-                      (user_id, INITIAL_DABLOONS + amount, 0))
-        conn.commit()
-        conn.close()
+        await aadd_usage_balance(user_id, amount)
         await ctx.send(f"Added {amount} usage dabloons to user {user_id}.")
 
     @commands.command(name="modifykarma", help="Modify a user's karma (admin only). Usage: !modifykarma <guild_id> <user_id> <amount>")
@@ -198,10 +164,99 @@ class AdminCommands(commands.Cog):
         if not is_admin(ctx):
             await ctx.send("You do not have permission to use this command.")
             return
-        from db import update_karma, get_karma
-        update_karma(guild_id, user_id, amount)
-        new_karma = get_karma(guild_id, user_id)
+        await aupdate_karma(guild_id, user_id, amount)
+        new_karma = await aget_karma(guild_id, user_id)
         await ctx.send(f"Updated karma for user {user_id} in guild {guild_id} by {amount}. New karma: {new_karma}")
 
+    @commands.command(name="rebuildreactiontotals", help="Recompute reaction totals from the raw reactions table (admin only).")
+    async def rebuildreactiontotals(self, ctx):
+        if not is_admin(ctx):
+            await ctx.send("You do not have permission to use this command.")
+            return
+        await arebuild_reaction_totals()
+        await ctx.send("Reaction totals have been rebuilt.")
+
+    @commands.command(name="reloadconfig", help="Reload static_config.json and recompile the alarming-words matcher (admin only).")
+    async def reloadconfig(self, ctx):
+        if not is_admin(ctx):
+            await ctx.send("You do not have permission to use this command.")
+            return
+        reload_static_config()
+        reload_alarming_words()
+        await ctx.send(f"Static config reloaded; {len(alarming_words)} alarming phrases active.")
+
+    @commands.command(name="dbstats", help="Show database write-queue statistics (admin only).")
+    async def dbstats(self, ctx):
+        if not is_admin(ctx):
+            await ctx.send("You do not have permission to use this command.")
+            return
+        lines = ["**Reaction write queue**"] + [f"{key}: {value}" for key, value in reaction_buffer.stats().items()]
+        lines += ["**Identity cache**"] + [f"{key}: {value}" for key, value in identity_cache.stats().items()]
+        lines += ["**Karma cache**"] + [f"{key}: {value}" for key, value in karma_cache.stats().items()]
+        lines += ["**Abbreviation cache**"] + [f"{key}: {value}" for key, value in abbreviation_cache.stats().items()]
+        await ctx.send("\n".join(lines))
+
+    @commands.command(name="imagestats", help="Show image cache statistics (admin only).")
+    async def imagestats(self, ctx):
+        if not is_admin(ctx):
+            await ctx.send("You do not have permission to use this command.")
+            return
+        lines = ["**Image cache**"] + [f"{key}: {value}" for key, value in image_cache.stats().items()]
+        await ctx.send("\n".join(lines))
+
+    @commands.command(name="perfstats", help="Show per-message routing overhead and prompt trimming (admin only).")
+    async def perfstats(self, ctx):
+        if not is_admin(ctx):
+            await ctx.send("You do not have permission to use this command.")
+            return
+        routes = message_routing.stats()
+        lines = ["**Message routing**"] + [
+            f"{route}: {stats['count']} messages, avg {stats['avg_us']}us, max {stats['max_us']}us"
+            for route, stats in routes.items()
+        ] if routes else ["No messages routed yet."]
+        lines += ["**Time to first reply text**"] + [
+            f"{label}: {stats['count']} replies, avg {stats['avg_us'] / 1000:.0f}ms, max {stats['max_us'] / 1000:.0f}ms"
+            for label, stats in reply_latency.stats().items()
+        ]
+        lines += ["**Context window**"] + [f"{key}: {value}" for key, value in window_stats.stats().items()]
+        await ctx.send("\n".join(lines))
+
+    @commands.command(name="jobs", help="Show scheduled jobs (admin only).")
+    async def jobs(self, ctx):
+        if not is_admin(ctx):
+            await ctx.send("You do not have permission to use this command.")
+            return
+        lines = ["**Scheduled jobs**"] + [
+            f"{name}: {stats['schedule']}, next {stats['next_run']}, {stats['runs']} runs, "
+            f"{stats['failures']} failures, last {stats['last_duration_ms']}ms"
+            for name, stats in scheduler.stats().items()
+        ]
+        await ctx.send("\n".join(lines))
+
+    @commands.command(name="runjob", help="Run a scheduled job now (admin only). Usage: !runjob <name>")
+    async def runjob(self, ctx, name: str):
+        if not is_admin(ctx):
+            await ctx.send("You do not have permission to use this command.")
+            return
+        if name not in scheduler.jobs:
+            await ctx.send(f"No job named {name}. Jobs: {', '.join(scheduler.jobs)}")
+            return
+        await scheduler.run_now(name)
+        await ctx.send(f"Job {name} finished.")
+
+
+async def backup_database():
+    path = await abackup_db(DB_BACKUP_DIR, DB_BACKUP_KEEP)
+    logger.info(f"Database backed up to {path}")
+
+
+async def checkpoint_database():
+    result = await acheckpoint()
+    logger.info(f"WAL checkpoint: {result}")
+
+
 async def setup(bot):
+    tz = pytz.timezone(SCHEDULER_TIMEZONE)
+    scheduler.register("db_backup", Daily(4, 0, tz), backup_database, jitter=600)
+    scheduler.register("db_checkpoint", Every(6 * 3600), checkpoint_database, jitter=300)
     await bot.add_cog(AdminCommands(bot))
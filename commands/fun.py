@@ -5,8 +5,7 @@ import os
 import random
 import asyncio
 import logging
-from db import get_connection, update_usage
-from config import INITIAL_DABLOONS
+from db import add_usage_balance
 from discord_helper import reply_split
 from talk import handle_prompt_chain
 
@@ -22,18 +21,7 @@ INSULTS = static_config.get("insults", [])
 
 
 def increase_tokens(user_id, amount):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT usage_balance FROM usage WHERE user_id = ?", (user_id,))
-    row = c.fetchone()
-    if row:
-        new_balance = row["usage_balance"] + amount
-        c.execute("UPDATE usage SET usage_balance = ? WHERE user_id = ?", (new_balance, user_id))
-    else:
-        c.execute("INSERT INTO usage (user_id, usage_balance, bank_balance) VALUES (?, ?, ?)",
-                  (user_id, INITIAL_DABLOONS + amount, 0))
-    conn.commit()
-    conn.close()
+    add_usage_balance(user_id, amount)
 
 class FunCommands(commands.Cog):
     def __init__(self, bot):
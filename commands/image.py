@@ -3,11 +3,10 @@ import base64
 import aiohttp
 from discord.ext import commands
 import logging
-import requests
 import io
 import discord
 
-from discord_helper import reply_split, get_msg
+from discord_helper import reply_split, get_record
 from openai_helper import get_image, edit_image
 from config import STABILITY_API_KEY
 from db import update_usage
@@ -100,21 +99,20 @@ class ImageCommands(commands.Cog):
     async def editimage(self, ctx, *, arg):
         author_id = ctx.author.id
         # check for message attachments first, then check for replied message attachments if there are no attachments
-        images = []
+        images_urls = []
         if ctx.message.attachments:
-            images = ctx.message.attachments
+            images_urls = [image.url for image in ctx.message.attachments]
         elif ctx.message.reference:
             try:
-                replied_message = await get_msg(self.bot, ctx.channel, ctx.message.reference.message_id)
-                if replied_message.attachments:
-                    images = replied_message.attachments
+                replied_message = await get_record(self.bot, ctx.channel, ctx.message.reference.message_id)
+                if replied_message.attachment_urls:
+                    images_urls = list(replied_message.attachment_urls)
             except Exception as e:
                 await reply_split(ctx.message, str(e))
                 return
         else:
             await reply_split(ctx.message, "Please attach or reply to an image to use this command!")
             return
-        images_urls = [image.url for image in images]
         try:
             response = await edit_image(prompt=arg, user_id=author_id, image_urls=images_urls)
             image_b64 = response.data[0].b64_json
@@ -124,6 +122,7 @@ class ImageCommands(commands.Cog):
             await reply_split(ctx.message, str(e))
 
 
+    # The Stability commands below need requests; import it inside them if they are re-enabled
     # @commands.command(name="sdultra", help="Generate an image using Stability SD Ultra.")
     # async def sdultra(self, ctx, *, arg): # todo, move a lot of this function to stability_helper.py
     #     author_id = ctx.author.id
@@ -1,57 +1,117 @@
 import discord
 from discord.ext import commands
 import logging
-from db import get_connection
-from config import UPVOTE_EMOJI, DOWNVOTE_EMOJI
-from discord_helper import get_msg
+import pytz
+from db import transaction, run_read, aget_top_messages, arebuild_reaction_totals, UNKNOWN_GUILD
+from config import UPVOTE_EMOJI, DOWNVOTE_EMOJI, SCHEDULER_TIMEZONE
+from scheduler import scheduler, Daily
 
 logger = logging.getLogger(__name__)
 
+def get_given_stats():
+    with transaction() as c:
+        c.execute(f"""
+            SELECT reactor_id,
+                   SUM(CASE WHEN value = ? THEN 1 ELSE 0 END) as up_given,
+                   SUM(CASE WHEN value = ? THEN 1 ELSE 0 END) as down_given
+            FROM reactions
+            GROUP BY reactor_id
+        """, (UPVOTE_EMOJI, DOWNVOTE_EMOJI))
+        return c.fetchall()
+
+def get_received_stats():
+    with transaction() as c:
+        c.execute(f"""
+            SELECT reactee_id,
+                   SUM(CASE WHEN value = ? THEN 1 ELSE 0 END) as up_received,
+                   SUM(CASE WHEN value = ? THEN 1 ELSE 0 END) as down_received
+            FROM reactions
+            GROUP BY reactee_id
+        """, (UPVOTE_EMOJI, DOWNVOTE_EMOJI))
+        return c.fetchall()
+
 def get_reaction_stats():
-    conn = get_connection()
-    c = conn.cursor()
     # Sum up reactions by reactor and recipient.
-    c.execute(f"""
-        SELECT reactor_id,
-               SUM(CASE WHEN value = ? THEN 1 ELSE 0 END) as up_given,
-               SUM(CASE WHEN value = ? THEN 1 ELSE 0 END) as down_given
-        FROM reactions
-        GROUP BY reactor_id
-    """, (UPVOTE_EMOJI, DOWNVOTE_EMOJI))
-    given = c.fetchall()
-
-    c.execute(f"""
-        SELECT reactee_id,
-               SUM(CASE WHEN value = ? THEN 1 ELSE 0 END) as up_received,
-               SUM(CASE WHEN value = ? THEN 1 ELSE 0 END) as down_received
-        FROM reactions
-        GROUP BY reactee_id
-    """, (UPVOTE_EMOJI, DOWNVOTE_EMOJI))
-    received = c.fetchall()
-
-    conn.close()
-    return given, received
+    with transaction():
+        return get_given_stats(), get_received_stats()
 
 def get_reaction_details():
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM reactions")
-    rows = c.fetchall()
-    conn.close()
+    with transaction() as c:
+        c.execute("SELECT * FROM reactions")
+        rows = c.fetchall()
     return rows
 
+def get_leaderboard(guild_id, top_n):
+    with transaction() as c:
+        c.execute("SELECT user_id, karma FROM karma WHERE guild_id = ? ORDER BY karma DESC LIMIT ?",
+                  (guild_id, top_n))
+        return c.fetchall()
+
+# The commands below read the reaction_totals rollup. Reactions recorded before guild ids were
+# stored sit under UNKNOWN_GUILD and are counted in every guild.
+
+def get_user_stats(guild_id, target):
+    with transaction() as c:
+        c.execute("""
+            SELECT SUM(up_given) as up_given,
+                   SUM(down_given) as down_given,
+                   SUM(up_received) as up_received,
+                   SUM(down_received) as down_received
+            FROM reaction_totals
+            WHERE guild_id IN (?, ?) AND user_id = ?
+        """, (guild_id, UNKNOWN_GUILD, target))
+        return c.fetchone()
+
+def get_ranked_ratios(guild_id, up_column, down_column, top_n, descending):
+    # ratio is up/down, or just up when there are no downvotes
+    order = "DESC" if descending else "ASC"
+    with transaction() as c:
+        c.execute(f"""
+            SELECT user_id,
+                   CASE WHEN SUM({down_column}) > 0
+                        THEN CAST(SUM({up_column}) AS REAL) / SUM({down_column})
+                        ELSE SUM({up_column})
+                   END as ratio
+            FROM reaction_totals
+            WHERE guild_id IN (?, ?)
+            GROUP BY user_id
+            HAVING SUM({up_column}) + SUM({down_column}) > 0
+            ORDER BY ratio {order}
+            LIMIT ?
+        """, (guild_id, UNKNOWN_GUILD, top_n))
+        return c.fetchall()
+
+def get_top_reactees(target, top_n):
+    with transaction() as c:
+        c.execute("""
+                    SELECT reactee_id, COUNT(*) as count
+                    FROM reactions
+                    WHERE reactor_id = ?
+                    GROUP BY reactee_id
+                    ORDER BY count DESC
+                    LIMIT ?
+                """, (target, top_n))
+        return c.fetchall()
+
+def get_top_reactors(target, top_n):
+    with transaction() as c:
+        c.execute("""
+                    SELECT reactor_id, COUNT(*) as count
+                    FROM reactions
+                    WHERE reactee_id = ?
+                    GROUP BY reactor_id
+                    ORDER BY count DESC
+                    LIMIT ?
+                """, (target, top_n))
+        return c.fetchall()
+
 class ReactionCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
     @commands.command(name="leaderboard", help="Display the karma leaderboard.")
     async def leaderboard(self, ctx, top_n: int = 10):
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute("SELECT user_id, karma FROM karma WHERE guild_id = ? ORDER BY karma DESC LIMIT ?",
-                  (ctx.guild.id, top_n))
-        rows = c.fetchall()
-        conn.close()
+        rows = await run_read(get_leaderboard, ctx.guild.id, top_n)
         if not rows:
             await ctx.send("No karma data available.")
             return
@@ -66,23 +126,7 @@ class ReactionCommands(commands.Cog):
     @commands.command(name="stats", help="Display your reaction statistics (upvotes/downvotes given and received).")
     async def stats(self, ctx, user_id: int = None):
         target = user_id or ctx.author.id
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute(f"""
-            SELECT 
-                SUM(CASE WHEN reactor_id = ? AND value = ? THEN 1 ELSE 0 END) as up_given,
-                SUM(CASE WHEN reactor_id = ? AND value = ? THEN 1 ELSE 0 END) as down_given,
-                SUM(CASE WHEN reactee_id = ? AND value = ? THEN 1 ELSE 0 END) as up_received,
-                SUM(CASE WHEN reactee_id = ? AND value = ? THEN 1 ELSE 0 END) as down_received
-            FROM reactions
-        """, (
-            target, UPVOTE_EMOJI,
-            target, DOWNVOTE_EMOJI,
-            target, UPVOTE_EMOJI,
-            target, DOWNVOTE_EMOJI,
-        ))
-        row = c.fetchone()
-        conn.close()
+        row = await run_read(get_user_stats, ctx.guild.id, target)
         embed = discord.Embed(title=f"Reaction Stats for User {target}", color=0xFFFF00)
         embed.add_field(name="Upvotes Given", value=row["up_given"] or 0, inline=False)
         embed.add_field(name="Downvotes Given", value=row["down_given"] or 0, inline=False)
@@ -97,28 +141,11 @@ class ReactionCommands(commands.Cog):
 
     @commands.command(name="haters", help="List the most hateful users based on upvote/downvote ratios of reactions given.")
     async def haters(self, ctx, top_n: int = 5):
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute(f"""
-            SELECT reactor_id,
-                   SUM(CASE WHEN value = ? THEN 1 ELSE 0 END) as up_given,
-                   SUM(CASE WHEN value = ? THEN 1 ELSE 0 END) as down_given
-            FROM reactions
-            GROUP BY reactor_id
-        """, (UPVOTE_EMOJI, DOWNVOTE_EMOJI))
-        rows = c.fetchall()
-        conn.close()
-        ratios = []
-        for row in rows:
-            up = row["up_given"] or 0
-            down = row["down_given"] or 0
-            ratio = up / down if down > 0 else up  # if down is 0, use up as the metric
-            ratios.append((row["reactor_id"], ratio))
         # For haters, we want the lowest ratio.
-        ratios.sort(key=lambda x: x[1])
+        rows = await run_read(get_ranked_ratios, ctx.guild.id, "up_given", "down_given", top_n, False)
         embed = discord.Embed(title="Most Hateful Users (by reactions given)", color=0x00DCB8)
         rank = 1
-        for user_id, ratio in ratios[:top_n]:
+        for user_id, ratio in rows:
             user = await self.bot.fetch_user(user_id)
             embed.add_field(name=f"{rank}. {user.display_name}", value=f"Ratio: {round(ratio, 2)}", inline=False)
             rank += 1
@@ -126,28 +153,11 @@ class ReactionCommands(commands.Cog):
 
     @commands.command(name="popularity", help="List the most popular users based on reactions received.")
     async def popularity(self, ctx, top_n: int = 5):
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute(f"""
-            SELECT reactee_id,
-                   SUM(CASE WHEN value = ? THEN 1 ELSE 0 END) as up_received,
-                   SUM(CASE WHEN value = ? THEN 1 ELSE 0 END) as down_received
-            FROM reactions
-            GROUP BY reactee_id
-        """, (UPVOTE_EMOJI, DOWNVOTE_EMOJI))
-        rows = c.fetchall()
-        conn.close()
-        ratios = []
-        for row in rows:
-            up = row["up_received"] or 0
-            down = row["down_received"] or 0
-            ratio = up / down if down > 0 else up
-            ratios.append((row["reactee_id"], ratio))
         # For popularity, we want the highest ratio.
-        ratios.sort(key=lambda x: x[1], reverse=True)
+        rows = await run_read(get_ranked_ratios, ctx.guild.id, "up_received", "down_received", top_n, True)
         embed = discord.Embed(title="Most Popular Users (by reactions received)", color=0x00DCB8)
         rank = 1
-        for user_id, ratio in ratios[:top_n]:
+        for user_id, ratio in rows:
             user = await self.bot.fetch_user(user_id)
             embed.add_field(name=f"{rank}. {user.display_name}", value=f"Ratio: {round(ratio, 2)}", inline=False)
             rank += 1
@@ -156,18 +166,7 @@ class ReactionCommands(commands.Cog):
     @commands.command(name="reactees", help="List the top 5 users you have reacted to.")
     async def reactees(self, ctx, top_n: int = 5):
         target = ctx.author.id
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute("""
-                    SELECT reactee_id, COUNT(*) as count
-                    FROM reactions
-                    WHERE reactor_id = ?
-                    GROUP BY reactee_id
-                    ORDER BY count DESC
-                    LIMIT ?
-                """, (target, top_n))
-        rows = c.fetchall()
-        conn.close()
+        rows = await run_read(get_top_reactees, target, top_n)
         embed = discord.Embed(title=f"Users {target} has reacted to", color=0xFFFF00)
         rank = 1
         for row in rows:
@@ -179,18 +178,7 @@ class ReactionCommands(commands.Cog):
     @commands.command(name="reactors", help="List the top 5 users who have reacted to you.")
     async def reactors(self, ctx, top_n: int = 5):
         target = ctx.author.id
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute("""
-                    SELECT reactor_id, COUNT(*) as count
-                    FROM reactions
-                    WHERE reactee_id = ?
-                    GROUP BY reactor_id
-                    ORDER BY count DESC
-                    LIMIT ?
-                """, (target, top_n))
-        rows = c.fetchall()
-        conn.close()
+        rows = await run_read(get_top_reactors, target, top_n)
         embed = discord.Embed(title=f"Users who reacted to {target}", color=0xFFFF00)
         rank = 1
         for row in rows:
@@ -201,43 +189,25 @@ class ReactionCommands(commands.Cog):
 
     @commands.command(name="topalltime", help="Show the top posts of all time based on reaction scores.")
     async def topalltime(self, ctx, top_n: int = 3):
-        conn = get_connection()
-        c = conn.cursor()
-        # compute a net score: +1 for upvote, -1 for downvote
-        c.execute(f"""
-            SELECT message_id,
-                   SUM(
-                     CASE
-                       WHEN value = ? THEN 1
-                       WHEN value = ? THEN -1
-                       ELSE 0
-                     END
-                   ) as score
-            FROM reactions
-            GROUP BY message_id
-            ORDER BY score DESC
-            LIMIT ?
-        """, (UPVOTE_EMOJI, DOWNVOTE_EMOJI, top_n))
-        rows = c.fetchall()
-        conn.close()
+        rows = await aget_top_messages(ctx.guild.id, top_n)
         if not rows:
             await ctx.send("No reaction data available.")
             return
         embed = discord.Embed(title=f"Top {top_n} All-Time Posts", color=0x00DCB8)
         rank = 1
         for row in rows:
-            # Try to fetch the message link by iterating through channels.
-            msg_link = "Link not found"
-            for channel in ctx.guild.text_channels:
-                try:
-                    msg = await get_msg(self.bot, channel, int(row["message_id"]))
-                    msg_link = msg.jump_url
-                    break
-                except Exception:
-                    continue
+            # Reactions recorded before channel ids were stored have no link until !scrapedata backfills them
+            if row["channel_id"]:
+                msg_link = f"https://discord.com/channels/{ctx.guild.id}/{row['channel_id']}/{row['message_id']}"
+            else:
+                msg_link = "Link not found"
             embed.add_field(name=f"{rank}. Score: {row['score']}", value=f"Message Link: {msg_link}", inline=False)
             rank += 1
         await ctx.send(embed=embed)
 
 async def setup(bot):
+    # reaction_totals and message_scores are kept up to date incrementally; the nightly
+    # rebuild from the raw reactions table repairs any drift
+    scheduler.register("reaction_rollups", Daily(5, 0, pytz.timezone(SCHEDULER_TIMEZONE)),
+                       arebuild_reaction_totals, jitter=600)
     await bot.add_cog(ReactionCommands(bot))
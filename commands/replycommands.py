@@ -2,7 +2,7 @@ import logging
 
 from discord.ext import commands
 
-from discord_helper import get_msg
+from discord_helper import get_msg, get_record
 from talk import handle_prompt_chain
 from utils import requires_credit
 
@@ -18,15 +18,14 @@ class ReplyCommands(commands.Cog):
         if not ctx.message.reference:
             await ctx.send("Error: Please reply to a message.")
             return
-        replied_message = await get_msg(self.bot, ctx.message.channel, ctx.message.reference.message_id)
+        replied_message = await get_record(self.bot, ctx.message.channel, ctx.message.reference.message_id)
         if not replied_message:
             await ctx.send("Error: Could not find the replied message.")
             return
-        if not replied_message.reference:
+        if not replied_message.reference_id:
             await ctx.send("Error: The replied message must be replying to a message.")
             return
-        grandparent = replied_message.reference
-        grandparent_message = await get_msg(self.bot, ctx.message.channel, grandparent.message_id)
+        grandparent_message = await get_msg(self.bot, ctx.message.channel, replied_message.reference_id)
         if not grandparent_message:
             await ctx.send("Error: Could not find the grandparent message to resend.")
             return
@@ -37,15 +36,14 @@ class ReplyCommands(commands.Cog):
         if not ctx.message.reference:
             await ctx.send("Error: Please reply to a message.")
             return
-        replied_message = await get_msg(self.bot, ctx.message.channel, ctx.message.reference.message_id)
+        replied_message = await get_record(self.bot, ctx.message.channel, ctx.message.reference.message_id)
         if not replied_message:
             await ctx.send("Error: Could not find the replied message.")
             return
-        if not replied_message.reference:
+        if not replied_message.reference_id:
             await ctx.send("Error: The replied message must be replying to a message.")
             return
-        grandparent = replied_message.reference
-        grandparent_message = await get_msg(self.bot, ctx.message.channel, grandparent.message_id)
+        grandparent_message = await get_msg(self.bot, ctx.message.channel, replied_message.reference_id)
         if not grandparent_message:
             await ctx.send("Error: Could not find the grandparent message to rewrite.")
             return
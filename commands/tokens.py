@@ -1,7 +1,6 @@
 from discord.ext import commands
 import discord
-from db import get_usage
-from db import update_usage
+from db import aget_usage
 
 class TokenCommands(commands.Cog):
     def __init__(self, bot):
@@ -11,7 +10,7 @@ class TokenCommands(commands.Cog):
     async def tokens(self, ctx, user_id: int = None):
         if user_id is None:
             user_id = ctx.author.id
-        data = get_usage(user_id)
+        data = await aget_usage(user_id)
         if data:
             usage_balance = data["usage_balance"]
             bank_balance = data["bank_balance"]
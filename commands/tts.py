@@ -4,8 +4,6 @@ from openai_helper import get_tts
 from discord_helper import reply_split
 import os
 import time
-from moviepy.video.VideoClip import ColorClip
-from moviepy.audio.io.AudioFileClip import AudioFileClip
 import io
 import discord
 from config import TTS_MODEL, TTS_HD_MODEL, DEFAULT_VOICE
@@ -19,6 +17,9 @@ class TTS(commands.Cog):
 
     # TODO: implement (dont forget reply)
     # async def reply_with_movie(self, ctx, response):
+    #     # moviepy is heavy and optional; import it here rather than at cog load
+    #     from moviepy.video.VideoClip import ColorClip
+    #     from moviepy.audio.io.AudioFileClip import AudioFileClip
     #     temp_audio = f"temp_speech{int(time.time())}.mp3"
     #     response.stream_to_file(temp_audio)
     #     # Create a black screen video clip with proper FPS and duration using updated moviepy
@@ -25,6 +25,50 @@ AVAILABLE_VOICES = ["alloy", "echo", "fable", "onyx", "nova", "shimmer"]
 UPVOTE_EMOJI = '🔥'
 DOWNVOTE_EMOJI ='🍅'
 
+# Reaction writes are buffered and committed together after this many seconds or events
+REACTION_FLUSH_INTERVAL = 0.5
+REACTION_FLUSH_MAX_EVENTS = 100
+# Recently reacted message_id -> author_id pairs kept in memory for removal events, which carry no author
+REACTION_AUTHOR_INDEX_SIZE = 10000
+
+# Reply chains are followed back at most this many messages. When a hop is not cached, one history
+# request fetches the missing message together with the CHAIN_HISTORY_WINDOW - 1 messages before it.
+MAX_CHAIN_DEPTH = 50
+CHAIN_HISTORY_WINDOW = 100
+
+# Images in a reply chain are downloaded this many at a time; larger or slower files are skipped
+ATTACHMENT_CONCURRENCY = 4
+ATTACHMENT_MAX_BYTES = 20 * 1024 * 1024
+ATTACHMENT_TIMEOUT = 15
+# Images are shrunk to fit IMAGE_MAX_SIDE (OpenAI scales anything larger down to fit 2048x2048 anyway),
+# re-encoded as IMAGE_FORMAT, and the resulting data URIs kept up to IMAGE_CACHE_BYTES in total
+IMAGE_MAX_SIDE = 2048
+IMAGE_FORMAT = "JPEG"
+IMAGE_QUALITY = 85
+IMAGE_CACHE_BYTES = 64 * 1024 * 1024
+
+# Prompts built from a reply chain are trimmed to this many tokens (system prompt, text, and an
+# estimate per image) by leaving out the middle of the conversation
+DEFAULT_CONTEXT_TOKEN_BUDGET = 32000
+CONTEXT_TOKEN_BUDGETS = {
+    "gpt-4": 6000,
+    "gpt-4.5-preview": 8000,
+    "o1-pro": 8000,
+}
+
+# Stream replies into Discord as they are generated, editing the message at most once per interval
+STREAM_RESPONSES = True
+STREAM_EDIT_INTERVAL = 1.0
+
+# A reply to the bot continues the stored OpenAI response while it is younger than this;
+# OpenAI keeps stored responses for 30 days
+RESPONSE_ID_TTL = 29 * 24 * 3600
+
+# Scheduled jobs run in this timezone; the daily allowance resets at its midnight
+SCHEDULER_TIMEZONE = "US/Eastern"
+DB_BACKUP_DIR = os.path.join("data", "backups")
+DB_BACKUP_KEEP = 7
+
 # Other settings
 INITIAL_DABLOONS = 0.5  # starting dollar balance
 
@@ -0,0 +1,112 @@
+import logging
+
+from config import CONTEXT_TOKEN_BUDGETS, DEFAULT_CONTEXT_TOKEN_BUDGET
+
+logger = logging.getLogger(__name__)
+
+# Chat-format overhead per turn, and a flat estimate per image: a high-detail image is scaled
+# to fit 1024x768 at most, which is four 512px tiles at 170 tokens each plus 85
+TOKENS_PER_TURN = 4
+TOKENS_PER_IMAGE = 765
+# Used instead of tiktoken when no encoding could be loaded
+CHARS_PER_TOKEN = 4
+
+_encoders = {}
+
+
+def get_encoder(model):
+    """
+    The tiktoken encoding for model, loaded once per model. tiktoken downloads encoding files
+    on first use, so call this off the event loop. None if it cannot be loaded; token counts
+    are then estimated from text length.
+    """
+    if model not in _encoders:
+        try:
+            import tiktoken
+            try:
+                encoder = tiktoken.encoding_for_model(model)
+            except KeyError:
+                encoder = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logger.warning(f"No tiktoken encoding for {model}, estimating tokens from length: {e}")
+            encoder = None
+        _encoders[model] = encoder
+    return _encoders[model]
+
+
+def count_tokens(text, encoder):
+    if encoder is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def turn_tokens(turn, encoder):
+    role, text, attachments = turn
+    return TOKENS_PER_TURN + count_tokens(text, encoder) + TOKENS_PER_IMAGE * len(attachments)
+
+
+class WindowStats:
+    """
+    How many prompts were trimmed to fit their budget, and by how much.
+    """
+
+    def __init__(self):
+        self.prompts = 0
+        self.trimmed_prompts = 0
+        self.turns_trimmed = 0
+        self.tokens_trimmed = 0
+        self.max_tokens_trimmed = 0
+
+    def record(self, turns_trimmed, tokens_trimmed):
+        self.prompts += 1
+        if turns_trimmed:
+            self.trimmed_prompts += 1
+            self.turns_trimmed += turns_trimmed
+            self.tokens_trimmed += tokens_trimmed
+            self.max_tokens_trimmed = max(self.max_tokens_trimmed, tokens_trimmed)
+
+    def stats(self):
+        return {
+            "prompts": self.prompts,
+            "trimmed_prompts": self.trimmed_prompts,
+            "turns_trimmed": self.turns_trimmed,
+            "tokens_trimmed": self.tokens_trimmed,
+            "max_tokens_trimmed": self.max_tokens_trimmed,
+        }
+
+
+window_stats = WindowStats()
+
+
+def fit_turns(system_msg, turns, model):
+    """
+    Trim [role, text, attachments] turns (earliest first) to the model's token budget.
+
+    The system prompt and the last turn are always kept, then the first turn (where the thread
+    started) if it fits, then as many of the most recent turns as fit. The turns in between are
+    replaced by a single note saying how many were left out. Returns (turns, tokens trimmed).
+    """
+    budget = CONTEXT_TOKEN_BUDGETS.get(model, DEFAULT_CONTEXT_TOKEN_BUDGET)
+    encoder = get_encoder(model)
+    costs = [turn_tokens(turn, encoder) for turn in turns]
+    system_cost = count_tokens(system_msg, encoder) if system_msg else 0
+    if len(turns) <= 2 or system_cost + sum(costs) <= budget:
+        window_stats.record(0, 0)
+        return turns, 0
+
+    remaining = budget - system_cost - costs[-1]
+    start = 0
+    if costs[0] <= remaining:
+        remaining -= costs[0]
+        start = 1
+    end = len(turns) - 1
+    while end > start and costs[end - 1] <= remaining:
+        end -= 1
+        remaining -= costs[end]
+
+    trimmed = sum(costs[start:end])
+    window_stats.record(end - start, trimmed)
+    logger.info(f"Left {end - start} of {len(turns)} turns ({trimmed} tokens) out of the prompt "
+                f"to fit the {budget} token budget for {model}")
+    note = ["system", f"[{end - start} earlier messages in this conversation were left out]", []]
+    return turns[:start] + [note] + turns[end:], trimmed
@@ -1,317 +1,937 @@
+import asyncio
+import functools
+import logging
 import sqlite3
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
-from config import INITIAL_DABLOONS, BOT_NAME, ADMIN_USER_ID
+from config import INITIAL_DABLOONS, BOT_NAME, ADMIN_USER_ID, UPVOTE_EMOJI, DOWNVOTE_EMOJI
+
+logger = logging.getLogger(__name__)
 
 DB_PATH = os.path.join("data", "bot.db")
 
+# Reactions recorded before guild ids were stored (or without a known guild) live under this guild id
+UNKNOWN_GUILD = 0
 
-def get_connection():
-    conn = sqlite3.connect(DB_PATH)
+# sqlite3 keeps an LRU of prepared statements per connection, so long-lived
+# connections reuse the compiled form of every query below.
+STATEMENT_CACHE_SIZE = 256
+
+# The async facade runs every write on one dedicated thread (so writers never contend
+# for the SQLite lock) and reads on a small pool; each thread keeps its own connection.
+READER_THREADS = 4
+
+IDENTITY_CACHE_SIZE = 4096
+KARMA_CACHE_SIZE = 4096
+ABBREVIATION_CACHE_SIZE = 1024
+
+# Stay well under SQLite's bound-parameter limit (999 on older builds) for IN (...) lookups
+MAX_IN_PARAMS = 500
+
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+_readers = ThreadPoolExecutor(max_workers=READER_THREADS, thread_name_prefix="db-reader")
+
+
+def _open_connection():
+    # check_same_thread is off only so close_connections() can run from the main thread;
+    # each connection is still confined to the thread that opened it.
+    conn = sqlite3.connect(DB_PATH, cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
     return conn
 
 
-def init_db(bot_id: int):
+def get_connection():
+    """
+    Return the calling thread's long-lived connection, opening it on first use.
+    Callers must not close it; close_connections() does that on shutdown.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _open_connection()
+        _local.conn = conn
+        _local.depth = 0
+        with _connections_lock:
+            _connections.append(conn)
+    return conn
+
+
+@contextmanager
+def transaction():
+    """
+    Yield a cursor on the thread's connection. Only the outermost block commits
+    (or rolls back on error), so helpers can call each other inside one transaction.
+    """
     conn = get_connection()
-    c = conn.cursor()
-    # Usage table: user_id, usage_balance, bank_balance, total_usage
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS usage (
-        user_id INTEGER PRIMARY KEY,
-        usage_balance REAL,
-        bank_balance REAL,
-        total_usage REAL DEFAULT 0
-    )
-    """)
-    # Karma table: guild_id, user_id, karma
+    _local.depth += 1
+    try:
+        yield conn.cursor()
+    except BaseException:
+        _local.depth -= 1
+        if _local.depth == 0:
+            conn.rollback()
+        raise
+    _local.depth -= 1
+    if _local.depth == 0:
+        conn.commit()
+
+
+def close_connections():
+    with _connections_lock:
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
+    _local.__dict__.clear()
+
+
+def shutdown():
+    """
+    Drain the writer and reader threads, then close every connection.
+    """
+    _writer.shutdown(wait=True)
+    _readers.shutdown(wait=True)
+    close_connections()
+
+
+async def run_read(func, *args, **kwargs):
+    """
+    Run a blocking read-only function on the reader pool.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_readers, functools.partial(func, *args, **kwargs))
+
+
+async def run_write(func, *args, **kwargs):
+    """
+    Run a blocking function that writes on the single writer thread.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_writer, functools.partial(func, *args, **kwargs))
+
+
+def _read(func):
+    async def wrapper(*args, **kwargs):
+        return await run_read(func, *args, **kwargs)
+    wrapper.__name__ = f"a{func.__name__}"
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+def _write(func):
+    async def wrapper(*args, **kwargs):
+        return await run_write(func, *args, **kwargs)
+    wrapper.__name__ = f"a{func.__name__}"
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+def init_db(bot_id: int):
+    with transaction() as c:
+        # Usage table: user_id, usage_balance, bank_balance, total_usage
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS usage (
+            user_id INTEGER PRIMARY KEY,
+            usage_balance REAL,
+            bank_balance REAL,
+            total_usage REAL DEFAULT 0
+        )
+        """)
+        # Karma table: guild_id, user_id, karma
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS karma (
+            guild_id INTEGER,
+            user_id INTEGER,
+            karma INTEGER DEFAULT 0,
+            PRIMARY KEY (guild_id, user_id)
+        )
+        """)
+        # Reaction table: message_id, reactor_id, reactee_id, value
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS reactions (
+            message_id TEXT,
+            reactor_id INTEGER,
+            reactee_id INTEGER,
+            value TEXT,
+            PRIMARY KEY (message_id, reactor_id, value)
+        )
+        """)
+        # Identities table: user_id, name, description
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS identities (
+            user_id INTEGER PRIMARY KEY,
+            name TEXT,
+            description TEXT
+        )
+        """)
+
+        # add to identities table bot_id as Gluemo
+        c.execute("""
+        INSERT OR IGNORE INTO identities (user_id, name, description) VALUES (?, ?, ?)
+        """, (bot_id, BOT_NAME, ""))
+
+        # meta info, like last reset date
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+        """)
+
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS abbreviations (
+            guild_id INTEGER,
+            user_id INTEGER,
+            key TEXT,
+            value TEXT,
+            PRIMARY KEY (guild_id, user_id, key)
+        )
+        """)
+
+    identity_cache.invalidate()
+    karma_cache.invalidate()
+    abbreviation_cache.invalidate()
+    migrate()
+
+
+def _add_column(c, table: str, column: str, definition: str):
+    """
+    Add a column unless it already exists. Existing rows keep their data and get the column default.
+    """
+    c.execute(f"PRAGMA table_info({table})")
+    if column not in {row["name"] for row in c.fetchall()}:
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _migration_1_reaction_indexes(c):
+    # Covering indexes for the reaction commands: per-reactor and per-reactee counts
+    # (!stats, !reactees, !reactors, !haters, !popularity) and per-message scores (!topalltime).
+    c.execute("CREATE INDEX IF NOT EXISTS idx_reactions_reactor ON reactions (reactor_id, value, reactee_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_reactions_reactee ON reactions (reactee_id, value, reactor_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_reactions_message ON reactions (message_id, value)")
+
+
+def _migration_2_reaction_totals(c):
+    # Per-guild rollup of reactions given/received, maintained alongside every reaction write
+    _add_column(c, "reactions", "guild_id", f"INTEGER DEFAULT {UNKNOWN_GUILD}")
     c.execute("""
-    CREATE TABLE IF NOT EXISTS karma (
+    CREATE TABLE IF NOT EXISTS reaction_totals (
         guild_id INTEGER,
         user_id INTEGER,
-        karma INTEGER DEFAULT 0,
+        up_given INTEGER DEFAULT 0,
+        down_given INTEGER DEFAULT 0,
+        up_received INTEGER DEFAULT 0,
+        down_received INTEGER DEFAULT 0,
         PRIMARY KEY (guild_id, user_id)
     )
     """)
-    # Reaction table: message_id, reactor_id, reactee_id, value
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS reactions (
-        message_id TEXT,
-        reactor_id INTEGER,
-        reactee_id INTEGER,
-        value TEXT,
-        PRIMARY KEY (message_id, reactor_id, value)
-    )
-    """)
-    # Identities table: user_id, name, description
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS identities (
-        user_id INTEGER PRIMARY KEY,
-        name TEXT,
-        description TEXT
-    )
-    """)
+    _rebuild_reaction_totals(c)
 
-    # add to identities table bot_id as Gluemo
-    c.execute("""
-    INSERT OR IGNORE INTO identities (user_id, name, description) VALUES (?, ?, ?)
-    """, (bot_id, BOT_NAME, ""))
 
-    # meta info, like last reset date
-    conn = get_connection()
-    c = conn.cursor()
+def _migration_3_message_scores(c):
+    # Where each reacted message lives, so links can be built without fetching, and its net score
+    _add_column(c, "reactions", "channel_id", "INTEGER")
     c.execute("""
-    CREATE TABLE IF NOT EXISTS meta (
-        key TEXT PRIMARY KEY,
-        value TEXT
+    CREATE TABLE IF NOT EXISTS message_scores (
+        message_id TEXT PRIMARY KEY,
+        guild_id INTEGER,
+        channel_id INTEGER,
+        author_id INTEGER,
+        score INTEGER DEFAULT 0
     )
     """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_message_scores_guild ON message_scores (guild_id, score DESC)")
+    _rebuild_message_scores(c)
+
+
+def _migration_4_usage_epoch(c):
+    # Daily allowances are refilled lazily: a row whose usage_epoch is behind meta.usage_epoch is stale
+    _add_column(c, "usage", "usage_epoch", "INTEGER DEFAULT 0")
 
+
+def _migration_5_response_ids(c):
+    # OpenAI response id behind each bot reply, so a reply to it can continue the conversation server-side
     c.execute("""
-    CREATE TABLE IF NOT EXISTS abbreviations (
-        guild_id INTEGER,
-        user_id INTEGER,
-        key TEXT,
-        value TEXT,
-        PRIMARY KEY (guild_id, user_id, key)
+    CREATE TABLE IF NOT EXISTS response_ids (
+        message_id INTEGER PRIMARY KEY,
+        response_id TEXT NOT NULL,
+        model_engine TEXT,
+        temperature REAL,
+        top_p REAL,
+        created_at REAL
     )
     """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_response_ids_created ON response_ids (created_at)")
+
 
-    conn.commit()
-    conn.close()
+# Schema migrations, applied in order. The number of applied steps is stored as
+# meta.schema_version, so only append to this list; never edit or reorder old steps.
+MIGRATIONS = [
+    _migration_1_reaction_indexes,
+    _migration_2_reaction_totals,
+    _migration_3_message_scores,
+    _migration_4_usage_epoch,
+    _migration_5_response_ids,
+]
+
+
+def get_schema_version():
+    with transaction() as c:
+        c.execute("SELECT value FROM meta WHERE key = 'schema_version'")
+        row = c.fetchone()
+    return int(row["value"]) if row else 0
+
+
+def migrate():
+    """
+    Apply every migration newer than meta.schema_version, each in its own transaction.
+    """
+    version = get_schema_version()
+    for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+        with transaction() as c:
+            step(c)
+            c.execute("REPLACE INTO meta (key, value) VALUES ('schema_version', ?)", (str(number),))
+        logger.info(f"Applied schema migration {number}: {step.__name__}")
 
 def set_abbreviation(guild_id: int, user_id: int, key: str, value: str):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("""
-        INSERT OR REPLACE INTO abbreviations (guild_id, user_id, key, value)
-        VALUES (?, ?, ?, ?)
-    """, (guild_id, user_id, key, value))
-    conn.commit()
-    conn.close()
+    with transaction() as c:
+        c.execute("""
+            INSERT OR REPLACE INTO abbreviations (guild_id, user_id, key, value)
+            VALUES (?, ?, ?, ?)
+        """, (guild_id, user_id, key, value))
+    abbreviation_cache.invalidate((guild_id, user_id))
 
 def get_abbreviation(guild_id: int, user_id: int, key: str):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("""
-        SELECT value FROM abbreviations WHERE guild_id = ? AND user_id = ? AND key = ?
-    """, (guild_id, user_id, key))
-    row = c.fetchone()
-    conn.close()
+    with transaction() as c:
+        c.execute("""
+            SELECT value FROM abbreviations WHERE guild_id = ? AND user_id = ? AND key = ?
+        """, (guild_id, user_id, key))
+        row = c.fetchone()
     return row["value"] if row else None
 
+def _load_abbreviations(guild_id: int, user_id: int):
+    version = abbreviation_cache.version
+    with transaction() as c:
+        c.execute("""
+            SELECT key, value FROM abbreviations WHERE guild_id = ? AND user_id = ?
+        """, (guild_id, user_id))
+        rows = c.fetchall()
+    abbrs = {row["key"]: row["value"] for row in rows}
+    abbreviation_cache.put((guild_id, user_id), abbrs, version)
+    return abbrs
+
 def get_all_abbreviations(guild_id: int, user_id: int):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("""
-        SELECT key, value FROM abbreviations WHERE guild_id = ? AND user_id = ?
-    """, (guild_id, user_id))
-    rows = c.fetchall()
-    conn.close()
-    return {row["key"]: row["value"] for row in rows}
+    """
+    Return a user's abbreviations as {key: value}. The dict is shared with the cache; do not modify it.
+    """
+    abbrs = abbreviation_cache.get((guild_id, user_id))
+    return _load_abbreviations(guild_id, user_id) if abbrs is _MISSING else abbrs
+
+async def aget_all_abbreviations(guild_id: int, user_id: int):
+    # prompt assembly expands every message in a reply chain, so hits skip the thread hop
+    abbrs = abbreviation_cache.get((guild_id, user_id))
+    return await run_read(_load_abbreviations, guild_id, user_id) if abbrs is _MISSING else abbrs
 
 def delete_abbreviation(guild_id: int, user_id: int, key: str):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("""
-        DELETE FROM abbreviations WHERE guild_id = ? AND user_id = ? AND key = ?
-    """, (guild_id, user_id, key))
-    conn.commit()
-    conn.close()
+    with transaction() as c:
+        c.execute("""
+            DELETE FROM abbreviations WHERE guild_id = ? AND user_id = ? AND key = ?
+        """, (guild_id, user_id, key))
+    abbreviation_cache.invalidate((guild_id, user_id))
 
 def set_meta(key: str, value: str):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
-    conn.commit()
-    conn.close()
+    with transaction() as c:
+        c.execute("REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
 
 def get_meta(key: str):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT value FROM meta WHERE key = ?", (key,))
-    row = c.fetchone()
-    conn.close()
+    with transaction() as c:
+        c.execute("SELECT value FROM meta WHERE key = ?", (key,))
+        row = c.fetchone()
     return row["value"] if row else None
 
+def compare_and_set_meta(key: str, expected, value: str):
+    """
+    Set meta[key] to value only if it still holds expected (None: the key is absent).
+    Returns whether the value was set, so concurrent callers can claim a change exactly once.
+    """
+    with transaction() as c:
+        if expected is None:
+            c.execute("INSERT OR IGNORE INTO meta (key, value) VALUES (?, ?)", (key, value))
+        else:
+            c.execute("UPDATE meta SET value = ? WHERE key = ? AND value = ?", (value, key, expected))
+        return c.rowcount == 1
+
+class LRUCache:
+    """
+    Bounded LRU of query results by key; None is a cacheable result, _MISSING means not cached.
+    Writers invalidate entries; a read that raced with a write does not repopulate the cache.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = 0
+
+    @property
+    def version(self):
+        return self._version
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return _MISSING
+
+    def put(self, key, value, version):
+        with self._lock:
+            if version != self._version:
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            self._version += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+_MISSING = object()
+# user_id -> (name, description), or None for users without an identities row
+identity_cache = LRUCache(IDENTITY_CACHE_SIZE)
+
+
+def _load_identity(user_id: int):
+    version = identity_cache.version
+    with transaction() as c:
+        c.execute("SELECT name, description FROM identities WHERE user_id = ?", (user_id,))
+        row = c.fetchone()
+    identity = (row["name"], row["description"]) if row else None
+    identity_cache.put(user_id, identity, version)
+    return identity
+
+
+def get_identity(user_id: int):
+    """
+    Return (name, description) for a user, or None if they have no identities row.
+    """
+    identity = identity_cache.get(user_id)
+    return _load_identity(user_id) if identity is _MISSING else identity
+
+
+async def aget_identity(user_id: int):
+    # cache hits are answered on the event loop without a thread hop
+    identity = identity_cache.get(user_id)
+    return await run_read(_load_identity, user_id) if identity is _MISSING else identity
+
+
+def _load_identities(user_ids):
+    version = identity_cache.version
+    identities = dict.fromkeys(user_ids)
+    with transaction() as c:
+        for i in range(0, len(user_ids), MAX_IN_PARAMS):
+            chunk = user_ids[i:i + MAX_IN_PARAMS]
+            c.execute(f"""
+                SELECT user_id, name, description FROM identities
+                WHERE user_id IN ({", ".join("?" * len(chunk))})
+            """, chunk)
+            for row in c.fetchall():
+                identities[row["user_id"]] = (row["name"], row["description"])
+    for user_id, identity in identities.items():
+        identity_cache.put(user_id, identity, version)
+    return identities
+
+
+def _split_cached(user_ids):
+    found, missing = {}, []
+    for user_id in dict.fromkeys(user_ids):
+        identity = identity_cache.get(user_id)
+        if identity is _MISSING:
+            missing.append(user_id)
+        else:
+            found[user_id] = identity
+    return found, missing
+
+
+def get_identities(user_ids):
+    """
+    Resolve many users at once: {user_id: (name, description) or None}.
+    Cached users are answered from memory and the rest with one IN (...) query per MAX_IN_PARAMS ids.
+    """
+    identities, missing = _split_cached(user_ids)
+    if missing:
+        identities.update(_load_identities(missing))
+    return identities
+
+
+async def aget_identities(user_ids):
+    identities, missing = _split_cached(user_ids)
+    if missing:
+        identities.update(await run_read(_load_identities, missing))
+    return identities
+
+
 def get_name(user_id: int):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT name FROM identities WHERE user_id = ?", (user_id,))
-    row = c.fetchone()
-    conn.close()
-    return row["name"] if row else None
+    identity = get_identity(user_id)
+    return identity[0] if identity else None
+
+
+async def aget_name(user_id: int):
+    identity = await aget_identity(user_id)
+    return identity[0] if identity else None
 
 
 def set_name(user_id: int, name: str):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("""
-            INSERT INTO identities (user_id, name)
-            VALUES (?, ?)
-            ON CONFLICT(user_id) DO UPDATE SET name=excluded.name
-        """, (user_id, name))
-    conn.commit()
-    conn.close()
+    with transaction() as c:
+        c.execute("""
+                INSERT INTO identities (user_id, name)
+                VALUES (?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET name=excluded.name
+            """, (user_id, name))
+    identity_cache.invalidate(user_id)
+
+
+def set_names(names: dict):
+    """
+    Upsert {user_id: name} for several users in a single transaction.
+    """
+    with transaction() as c:
+        c.executemany("""
+                INSERT INTO identities (user_id, name)
+                VALUES (?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET name=excluded.name
+            """, names.items())
+    for user_id in names:
+        identity_cache.invalidate(user_id)
 
 
 def get_description(user_id: int):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT description FROM identities WHERE user_id = ?", (user_id,))
-    row = c.fetchone()
-    conn.close()
-    return row["description"] if row else None
+    identity = get_identity(user_id)
+    return identity[1] if identity else None
+
+
+async def aget_description(user_id: int):
+    identity = await aget_identity(user_id)
+    return identity[1] if identity else None
 
 
 def set_description(user_id: int, description: str):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute(
-        """
-        INSERT INTO identities (user_id, description)
-        VALUES (?, ?)
-        ON CONFLICT(user_id) DO UPDATE
-          SET description=excluded.description
-        """,
-        (user_id, description),
-    )
-    conn.commit()
-    conn.close()
+    with transaction() as c:
+        c.execute(
+            """
+            INSERT INTO identities (user_id, description)
+            VALUES (?, ?)
+            ON CONFLICT(user_id) DO UPDATE
+              SET description=excluded.description
+            """,
+            (user_id, description),
+        )
+    identity_cache.invalidate(user_id)
+
+
+# The allowance epoch advances once per day (reset_usage) instead of rewriting every usage row.
+# A row from an older epoch is refilled to the allowance (10x for the admin) the next time it
+# is read or debited; new rows start in the current epoch.
+USAGE_EPOCH = "COALESCE((SELECT CAST(value AS INTEGER) FROM meta WHERE key = 'usage_epoch'), 0)"
+USAGE_ALLOWANCE = f"""
+    (SELECT CAST(value AS REAL) FROM meta WHERE key = 'usage_allowance')
+    * CASE WHEN user_id = :admin_id THEN 10 ELSE 1 END
+"""
+
+USAGE_REFILL = f"""
+    UPDATE usage SET usage_balance = {USAGE_ALLOWANCE}, usage_epoch = {USAGE_EPOCH}
+    WHERE user_id = :user_id AND usage_epoch < {USAGE_EPOCH}
+"""
+
+# usage_balance as it will read once any pending refill is applied, for listings that should not write
+EFFECTIVE_USAGE_BALANCE = f"""
+    CASE WHEN usage_epoch < {USAGE_EPOCH} THEN {USAGE_ALLOWANCE} ELSE usage_balance END AS usage_balance
+"""
+
+
+def _refill_usage(c, user_id):
+    c.execute(USAGE_REFILL, {"user_id": user_id, "admin_id": ADMIN_USER_ID})
 
 
 def get_usage(user_id: int):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT usage_balance, bank_balance FROM usage WHERE user_id = ?", (user_id,))
-    row = c.fetchone()
-    if not row:
-        # put them in database
-        c.execute("INSERT INTO usage (user_id, usage_balance, bank_balance) VALUES (?, ?, ?)",
-                    (user_id, INITIAL_DABLOONS, 0))
-        conn.commit()
+    with transaction() as c:
+        _refill_usage(c, user_id)
         c.execute("SELECT usage_balance, bank_balance FROM usage WHERE user_id = ?", (user_id,))
         row = c.fetchone()
-    conn.close()
+        if not row:
+            # put them in database
+            c.execute(f"INSERT INTO usage (user_id, usage_balance, bank_balance, usage_epoch) VALUES (?, ?, ?, {USAGE_EPOCH})",
+                        (user_id, INITIAL_DABLOONS, 0))
+            c.execute("SELECT usage_balance, bank_balance FROM usage WHERE user_id = ?", (user_id,))
+            row = c.fetchone()
     return row if row else None
 
 def get_balance(user_id: int):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT usage_balance, bank_balance FROM usage WHERE user_id = ?", (user_id,))
-    row = c.fetchone()
-    if not row:
-        # put them in database
-        c.execute("INSERT INTO usage (user_id, usage_balance, bank_balance) VALUES (?, ?, ?)",
-                    (user_id, INITIAL_DABLOONS, 0))
-        conn.commit()
-        c.execute("SELECT usage_balance, bank_balance FROM usage WHERE user_id = ?", (user_id,))
-        row = c.fetchone()
-    conn.close()
+    row = get_usage(user_id)
     return row["usage_balance"] if row else None
 
 def positive_balance(user_id: int):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT usage_balance FROM usage WHERE user_id = ?", (user_id,))
-    row = c.fetchone()
-    conn.close()
+    with transaction() as c:
+        _refill_usage(c, user_id)
+        c.execute("SELECT usage_balance FROM usage WHERE user_id = ?", (user_id,))
+        row = c.fetchone()
     return row["usage_balance"] > 0 if row else False
 
 
 def update_usage(user_id: int, delta, initial_balance=INITIAL_DABLOONS):
-    conn = get_connection()
-    c = conn.cursor()
-    usage = get_usage(user_id)
-    if usage is None:
-        c.execute("INSERT INTO usage (user_id, usage_balance, bank_balance) VALUES (?, ?, ?)",
-                  (user_id, initial_balance - delta, 0))
-    else:
-        new_balance = usage["usage_balance"] - delta
-        if new_balance < 0:
-            # If not enough usage, subtract the remainder from bank_balance
-            remainder = -new_balance
-            new_bank = max(usage["bank_balance"] - remainder, 0)
-            new_balance = 0
-            c.execute(
-                "UPDATE usage SET usage_balance = ?, bank_balance = ?, total_usage = total_usage + ? WHERE user_id = ?",
-                (new_balance, new_bank, delta, user_id))
+    """
+    Debit delta from a user's daily balance, spilling any shortfall into their bank balance.
+    This is a single UPSERT: every SET expression sees the same pre-update row, so
+    concurrent debits can never read a stale balance and overwrite each other.
+    """
+    with transaction() as c:
+        _refill_usage(c, user_id)
+        c.execute(f"""
+            INSERT INTO usage (user_id, usage_balance, bank_balance, total_usage, usage_epoch)
+            VALUES (:user_id, MAX(:initial_balance - :delta, 0), 0, :delta, {USAGE_EPOCH})
+            ON CONFLICT(user_id) DO UPDATE SET
+                usage_balance = MAX(usage_balance - :delta, 0),
+                bank_balance = CASE
+                    WHEN usage_balance - :delta < 0 THEN MAX(bank_balance + usage_balance - :delta, 0)
+                    ELSE bank_balance
+                END,
+                total_usage = total_usage + :delta
+        """, {"user_id": user_id, "delta": delta, "initial_balance": initial_balance})
+
+
+def add_usage_balance(user_id: int, amount):
+    with transaction() as c:
+        _refill_usage(c, user_id)
+        c.execute("SELECT usage_balance FROM usage WHERE user_id = ?", (user_id,))
+        row = c.fetchone()
+        if row:
+            new_usage = row["usage_balance"] + amount
+            c.execute("UPDATE usage SET usage_balance = ? WHERE user_id = ?", (new_usage, user_id))
+        else:
+            c.execute(f"INSERT INTO usage (user_id, usage_balance, bank_balance, usage_epoch) VALUES (?, ?, ?, {USAGE_EPOCH})",
+                      (user_id, INITIAL_DABLOONS + amount, 0))
+
+
+def add_bank_balance(user_id: int, amount):
+    with transaction() as c:
+        c.execute("SELECT bank_balance FROM usage WHERE user_id = ?", (user_id,))
+        row = c.fetchone()
+        if row:
+            new_bank = row["bank_balance"] + amount
+            c.execute("UPDATE usage SET bank_balance = ? WHERE user_id = ?", (new_bank, user_id))
         else:
-            c.execute(
-                "UPDATE usage SET usage_balance = usage_balance - ?, total_usage = total_usage + ? WHERE user_id = ?",
-                (delta, delta, user_id))
-    conn.commit()
-    conn.close()
+            c.execute(f"INSERT INTO usage (user_id, usage_balance, bank_balance, usage_epoch) VALUES (?, ?, ?, {USAGE_EPOCH})",
+                      (user_id, INITIAL_DABLOONS, amount))
+
+
+def get_all_usage():
+    with transaction() as c:
+        c.execute(f"SELECT user_id, {EFFECTIVE_USAGE_BALANCE}, bank_balance, total_usage FROM usage",
+                  {"admin_id": ADMIN_USER_ID})
+        return c.fetchall()
 
 
 def reset_usage(initial_balance):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("UPDATE usage SET usage_balance = ?", (initial_balance,))
-    # set admin user_id to 10 * initial_balance
-    c.execute("UPDATE usage SET usage_balance = ? WHERE user_id = ?", (10 * initial_balance, ADMIN_USER_ID))
-    conn.commit()
-    conn.close()
+    """
+    Start a new allowance epoch. This touches two meta rows regardless of the user count;
+    each usage row is refilled to initial_balance (10x for the admin) when it is next used.
+    """
+    with transaction() as c:
+        c.execute("""
+            INSERT INTO meta (key, value) VALUES ('usage_epoch', '1')
+            ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+        """)
+        c.execute("REPLACE INTO meta (key, value) VALUES ('usage_allowance', ?)", (str(initial_balance),))
+
+
+# (guild_id, user_id) -> karma
+karma_cache = LRUCache(KARMA_CACHE_SIZE)
+# (guild_id, user_id) -> {key: value}
+abbreviation_cache = LRUCache(ABBREVIATION_CACHE_SIZE)
+
+
+def _load_karma(guild_id: int, user_id: int):
+    version = karma_cache.version
+    with transaction() as c:
+        c.execute("SELECT karma FROM karma WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
+        row = c.fetchone()
+    karma = row["karma"] if row else 0
+    karma_cache.put((guild_id, user_id), karma, version)
+    return karma
 
 
 def get_karma(guild_id: int, user_id: int):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT karma FROM karma WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
-    row = c.fetchone()
-    conn.close()
-    return row["karma"] if row else 0
+    karma = karma_cache.get((guild_id, user_id))
+    return _load_karma(guild_id, user_id) if karma is _MISSING else karma
+
+
+async def aget_karma(guild_id: int, user_id: int):
+    karma = karma_cache.get((guild_id, user_id))
+    return await run_read(_load_karma, guild_id, user_id) if karma is _MISSING else karma
+
+
+KARMA_UPSERT = """
+    INSERT INTO karma (guild_id, user_id, karma) VALUES (?, ?, ?)
+    ON CONFLICT(guild_id, user_id) DO UPDATE SET karma = karma + excluded.karma
+"""
 
 
 def update_karma(guild_id: int, user_id: int, delta):
-    conn = get_connection()
-    c = conn.cursor()
-    karma = get_karma(guild_id, user_id)
-    if karma is None:
-        c.execute("INSERT INTO karma (guild_id, user_id, karma) VALUES (?, ?, ?)", (guild_id, user_id, delta))
-    else:
-        c.execute("UPDATE karma SET karma = karma + ? WHERE guild_id = ? AND user_id = ?", (delta, guild_id, user_id))
-    conn.commit()
-    conn.close()
+    with transaction() as c:
+        c.execute(KARMA_UPSERT, (guild_id, user_id, delta))
+    karma_cache.invalidate((guild_id, user_id))
 
 
 # python
-def add_reaction(message_id: int, user_id: int, author_id: int, value: str):
+TOTALS_UPSERT = """
+    INSERT INTO reaction_totals (guild_id, user_id, up_given, down_given, up_received, down_received)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(guild_id, user_id) DO UPDATE SET
+        up_given = up_given + excluded.up_given,
+        down_given = down_given + excluded.down_given,
+        up_received = up_received + excluded.up_received,
+        down_received = down_received + excluded.down_received
+"""
+
+
+SCORE_UPSERT = """
+    INSERT INTO message_scores (message_id, guild_id, channel_id, author_id, score)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(message_id) DO UPDATE SET
+        score = score + excluded.score,
+        guild_id = CASE WHEN guild_id = 0 THEN excluded.guild_id ELSE guild_id END,
+        channel_id = COALESCE(channel_id, excluded.channel_id)
+"""
+
+
+def _bump_score(c, guild_id, channel_id, message_id, author_id, value, sign):
+    if value == UPVOTE_EMOJI:
+        c.execute(SCORE_UPSERT, (str(message_id), guild_id, channel_id, author_id, sign))
+    elif value == DOWNVOTE_EMOJI:
+        c.execute(SCORE_UPSERT, (str(message_id), guild_id, channel_id, author_id, -sign))
+
+
+def _bump_totals(c, guild_id, reactor_id, reactee_id, value, sign, given=True, received=True):
+    if value == UPVOTE_EMOJI:
+        up, down = sign, 0
+    elif value == DOWNVOTE_EMOJI:
+        up, down = 0, sign
+    else:
+        return
+    if given:
+        c.execute(TOTALS_UPSERT, (guild_id, reactor_id, up, down, 0, 0))
+    if received:
+        c.execute(TOTALS_UPSERT, (guild_id, reactee_id, 0, 0, up, down))
+
+
+def _store_reaction(c, guild_id, channel_id, message_id, reactor_id, reactee_id, value):
+    # Upsert one reaction row and keep reaction_totals/message_scores in step within the caller's transaction
+    value = str(value)
+    c.execute("""
+        SELECT guild_id, channel_id, reactee_id FROM reactions WHERE message_id = ? AND reactor_id = ? AND value = ?
+    """, (message_id, reactor_id, value))
+    row = c.fetchone()
+    if row is None:
+        c.execute("""
+            INSERT INTO reactions (message_id, reactor_id, reactee_id, value, guild_id, channel_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (message_id, reactor_id, reactee_id, value, guild_id, channel_id))
+        _bump_totals(c, guild_id, reactor_id, reactee_id, value, 1)
+        _bump_score(c, guild_id, channel_id, message_id, reactee_id, value, 1)
+        return
+    if row["channel_id"] is None and channel_id is not None:
+        # Older rows do not know where they live; the rollups are re-attributed by rebuild_reaction_totals()
+        c.execute("""
+            UPDATE reactions SET guild_id = ?, channel_id = ? WHERE message_id = ? AND reactor_id = ? AND value = ?
+        """, (guild_id, channel_id, message_id, reactor_id, value))
+    if row["reactee_id"] != reactee_id:
+        c.execute("UPDATE reactions SET reactee_id = ? WHERE message_id = ? AND reactor_id = ? AND value = ?",
+                  (reactee_id, message_id, reactor_id, value))
+        _bump_totals(c, row["guild_id"], reactor_id, row["reactee_id"], value, -1, given=False)
+        _bump_totals(c, row["guild_id"], reactor_id, reactee_id, value, 1, given=False)
+
+
+def _delete_reaction(c, message_id, reactor_id, value):
     value = str(value)
-    conn = get_connection()
-    c = conn.cursor()
     c.execute("""
-        INSERT INTO reactions (message_id, reactor_id, reactee_id, value)
-        VALUES (?, ?, ?, ?)
-        ON CONFLICT(message_id, reactor_id, value) DO UPDATE
-          SET reactee_id = excluded.reactee_id
-    """, (message_id, user_id, author_id, value))
-    conn.commit()
-    conn.close()
+        SELECT guild_id, channel_id, reactee_id FROM reactions WHERE message_id = ? AND reactor_id = ? AND value = ?
+    """, (message_id, reactor_id, value))
+    row = c.fetchone()
+    if row is not None:
+        c.execute("DELETE FROM reactions WHERE message_id = ? AND reactor_id = ? AND value = ?",
+                  (message_id, reactor_id, value))
+        _bump_totals(c, row["guild_id"], reactor_id, row["reactee_id"], value, -1)
+        _bump_score(c, row["guild_id"], row["channel_id"], message_id, row["reactee_id"], value, -1)
+
+
+def add_reaction(message_id: int, user_id: int, author_id: int, value: str,
+                 guild_id: int = UNKNOWN_GUILD, channel_id: int = None):
+    with transaction() as c:
+        _store_reaction(c, guild_id, channel_id, message_id, user_id, author_id, value)
+
+
+def add_reactions(rows, guild_id: int = UNKNOWN_GUILD):
+    """
+    Bulk upsert of (message_id, channel_id, reactor_id, reactee_id, value) tuples in one transaction.
+    """
+    with transaction() as c:
+        for message_id, channel_id, reactor_id, reactee_id, value in rows:
+            _store_reaction(c, guild_id, channel_id, message_id, reactor_id, reactee_id, value)
 
 
 def remove_reaction(message_id: int, user_id: int, value: str):
-    value = str(value)
-    conn = get_connection()
-    c = conn.cursor()
-    # Delete the reaction
-    c.execute("DELETE FROM reactions WHERE message_id = ? AND reactor_id = ? AND value = ?",
-              (message_id, user_id, value))
-    conn.commit()
-    conn.close()
+    with transaction() as c:
+        _delete_reaction(c, message_id, user_id, value)
+
+
+def apply_reaction_batch(karma_deltas, added, removed):
+    """
+    Apply a coalesced batch of reaction events in one transaction.
+    karma_deltas: [(guild_id, user_id, delta)],
+    added: [(guild_id, channel_id, message_id, reactor_id, reactee_id, value)],
+    removed: [(message_id, reactor_id, value)].
+    """
+    with transaction() as c:
+        c.executemany(KARMA_UPSERT, karma_deltas)
+        for guild_id, channel_id, message_id, reactor_id, reactee_id, value in added:
+            _store_reaction(c, guild_id, channel_id, message_id, reactor_id, reactee_id, value)
+        for message_id, reactor_id, value in removed:
+            _delete_reaction(c, message_id, reactor_id, value)
+    for guild_id, user_id, _ in karma_deltas:
+        karma_cache.invalidate((guild_id, user_id))
+
+
+def _rebuild_reaction_totals(c):
+    c.execute("DELETE FROM reaction_totals")
+    c.execute("""
+        INSERT INTO reaction_totals (guild_id, user_id, up_given, down_given, up_received, down_received)
+        SELECT guild_id, user_id, SUM(up_given), SUM(down_given), SUM(up_received), SUM(down_received)
+        FROM (
+            SELECT guild_id, reactor_id AS user_id,
+                   value = :up AS up_given, value = :down AS down_given, 0 AS up_received, 0 AS down_received
+            FROM reactions WHERE value IN (:up, :down)
+            UNION ALL
+            SELECT guild_id, reactee_id AS user_id,
+                   0, 0, value = :up, value = :down
+            FROM reactions WHERE value IN (:up, :down)
+        )
+        GROUP BY guild_id, user_id
+    """, {"up": UPVOTE_EMOJI, "down": DOWNVOTE_EMOJI})
+
+
+def _rebuild_message_scores(c):
+    c.execute("DELETE FROM message_scores")
+    c.execute("""
+        INSERT INTO message_scores (message_id, guild_id, channel_id, author_id, score)
+        SELECT message_id, MAX(guild_id), MAX(channel_id), MAX(reactee_id),
+               SUM(CASE WHEN value = :up THEN 1 ELSE -1 END)
+        FROM reactions WHERE value IN (:up, :down)
+        GROUP BY message_id
+    """, {"up": UPVOTE_EMOJI, "down": DOWNVOTE_EMOJI})
+
+
+def rebuild_reaction_totals():
+    """
+    Recompute reaction_totals and message_scores from the raw reactions table in one transaction.
+    """
+    with transaction() as c:
+        _rebuild_reaction_totals(c)
+        _rebuild_message_scores(c)
+
+
+def get_message_author(message_id: int):
+    """
+    Author of a message that has had an up/down vote recorded, or None if it never has.
+    """
+    with transaction() as c:
+        c.execute("SELECT author_id FROM message_scores WHERE message_id = ?", (str(message_id),))
+        row = c.fetchone()
+    return row["author_id"] if row else None
+
+
+def set_response_id(message_ids, response_id: str, model_engine: str, temperature: float, top_p: float):
+    """
+    Record the response id (and the parameters it was made with) for every message a reply was split into.
+    """
+    now = time.time()
+    with transaction() as c:
+        c.executemany("""
+            REPLACE INTO response_ids (message_id, response_id, model_engine, temperature, top_p, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(message_id, response_id, model_engine, temperature, top_p, now) for message_id in message_ids])
+
+
+def get_response_id(message_id: int, max_age: float):
+    """
+    The response behind a bot message as a dict, or None if there is none younger than max_age seconds.
+    """
+    with transaction() as c:
+        c.execute("""
+            SELECT response_id, model_engine, temperature, top_p FROM response_ids
+            WHERE message_id = ? AND created_at > ?
+        """, (message_id, time.time() - max_age))
+        row = c.fetchone()
+    return dict(row) if row else None
+
+
+def prune_response_ids(max_age: float):
+    """
+    Delete response ids older than max_age seconds. Returns how many were deleted.
+    """
+    with transaction() as c:
+        c.execute("DELETE FROM response_ids WHERE created_at <= ?", (time.time() - max_age,))
+        return c.rowcount
+
+
+def get_top_messages(guild_id: int, limit: int):
+    """
+    Highest-scoring messages in a guild (plus ones recorded before guild ids were stored).
+    """
+    with transaction() as c:
+        c.execute("""
+            SELECT message_id, channel_id, score FROM message_scores
+            WHERE guild_id IN (?, ?) ORDER BY score DESC LIMIT ?
+        """, (guild_id, UNKNOWN_GUILD, limit))
+        return c.fetchall()
 
 
 def get_karma_snippet(guild_id: int, limit: int=5):
     """
     Return a snippet (top users by karma) for a guild as a dict {user_id: karma}.
     """
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("""
-        SELECT user_id, karma FROM karma WHERE guild_id = ? ORDER BY karma DESC LIMIT ?
-    """, (guild_id, limit))
-    rows = c.fetchall()
-    conn.close()
+    with transaction() as c:
+        c.execute("""
+            SELECT user_id, karma FROM karma WHERE guild_id = ? ORDER BY karma DESC LIMIT ?
+        """, (guild_id, limit))
+        rows = c.fetchall()
     return {row["user_id"]: row["karma"] for row in rows}
 
 
@@ -319,13 +939,11 @@ def get_usage_snippet(limit: int=5):
     """
     Return a snippet of usage data as a dict {user_id: (usage_balance, bank_balance)}.
     """
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("""
-        SELECT user_id, usage_balance, bank_balance FROM usage ORDER BY usage_balance DESC LIMIT ?
-    """, (limit,))
-    rows = c.fetchall()
-    conn.close()
+    with transaction() as c:
+        c.execute(f"""
+            SELECT user_id, {EFFECTIVE_USAGE_BALANCE}, bank_balance FROM usage ORDER BY usage_balance DESC LIMIT :limit
+        """, {"limit": limit, "admin_id": ADMIN_USER_ID})
+        rows = c.fetchall()
     return {row["user_id"]: (row["usage_balance"], row["bank_balance"]) for row in rows}
 
 
@@ -333,11 +951,88 @@ def get_identities_snippet(limit: int=5):
     """
     Return a snippet of identities as a dict {user_id: (name, description)}.
     """
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("""
-        SELECT user_id, name, description FROM identities LIMIT ?
-    """, (limit,))
-    rows = c.fetchall()
-    conn.close()
+    with transaction() as c:
+        c.execute("""
+            SELECT user_id, name, description FROM identities LIMIT ?
+        """, (limit,))
+        rows = c.fetchall()
     return {row["user_id"]: (row["name"], row["description"]) for row in rows}
+
+
+def drop_table(table_name: str):
+    with transaction() as c:
+        c.execute(f"DROP TABLE IF EXISTS {table_name}")
+    if table_name == "identities":
+        identity_cache.invalidate()
+    elif table_name == "karma":
+        karma_cache.invalidate()
+    elif table_name == "abbreviations":
+        abbreviation_cache.invalidate()
+
+
+def backup_db(backup_dir: str, keep: int):
+    """
+    Copy the database to backup_dir/bot-<timestamp>.db with SQLite's online backup API
+    and delete all but the newest keep backups. Returns the new backup's path.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    path = os.path.join(backup_dir, f"bot-{time.strftime('%Y%m%d-%H%M%S')}.db")
+    target = sqlite3.connect(path)
+    try:
+        get_connection().backup(target)
+    finally:
+        target.close()
+    backups = sorted(name for name in os.listdir(backup_dir) if name.startswith("bot-") and name.endswith(".db"))
+    for name in backups[:-keep]:
+        os.remove(os.path.join(backup_dir, name))
+    return path
+
+
+def checkpoint():
+    """
+    Fold the WAL back into the database file, truncate it, and refresh query planner statistics.
+    """
+    conn = get_connection()
+    busy, log_pages, checkpointed = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    conn.execute("PRAGMA optimize")
+    return {"busy": busy, "log_pages": log_pages, "checkpointed": checkpointed}
+
+
+# Async facade. Event handlers and cogs await these so that lock waits and fsyncs
+# happen off the event loop. get_usage/get_balance/positive_balance refill stale
+# allowances and insert missing rows, so they write.
+ainit_db = _write(init_db)
+aset_abbreviation = _write(set_abbreviation)
+aget_abbreviation = _read(get_abbreviation)
+adelete_abbreviation = _write(delete_abbreviation)
+aset_meta = _write(set_meta)
+aget_meta = _read(get_meta)
+acompare_and_set_meta = _write(compare_and_set_meta)
+aset_name = _write(set_name)
+aset_names = _write(set_names)
+aset_description = _write(set_description)
+aget_usage = _write(get_usage)
+aget_balance = _write(get_balance)
+apositive_balance = _write(positive_balance)
+aupdate_usage = _write(update_usage)
+aadd_usage_balance = _write(add_usage_balance)
+aadd_bank_balance = _write(add_bank_balance)
+aget_all_usage = _read(get_all_usage)
+areset_usage = _write(reset_usage)
+aupdate_karma = _write(update_karma)
+aadd_reaction = _write(add_reaction)
+aadd_reactions = _write(add_reactions)
+aremove_reaction = _write(remove_reaction)
+aapply_reaction_batch = _write(apply_reaction_batch)
+arebuild_reaction_totals = _write(rebuild_reaction_totals)
+aget_message_author = _read(get_message_author)
+aset_response_id = _write(set_response_id)
+aget_response_id = _read(get_response_id)
+aprune_response_ids = _write(prune_response_ids)
+aget_top_messages = _read(get_top_messages)
+aget_karma_snippet = _read(get_karma_snippet)
+aget_usage_snippet = _read(get_usage_snippet)
+aget_identities_snippet = _read(get_identities_snippet)
+adrop_table = _write(drop_table)
+abackup_db = _read(backup_db)
+acheckpoint = _write(checkpoint)
@@ -7,54 +7,394 @@ import discord
 import math
 import re
 import logging
+import time
+
+from config import CHAIN_HISTORY_WINDOW, STREAM_EDIT_INTERVAL
+from perf import reply_latency
 
 logger = logging.getLogger(__name__)
 
+# Messages seen on the gateway, by id, kept current by message/edit/delete events.
+# discord.py's own bot.cached_messages is a deque, so looking an id up in it is a linear scan.
+message_index = OrderedDict()
+INDEX_MAXSIZE = 1000
+
+# Records of messages we had to fetch over REST, with the time they stop being trusted
 cache = OrderedDict()
-MAXSIZE = 300
+MAXSIZE = 1000
+CACHE_TTL = 600
+MISSING_MAXSIZE = 300
+
+# Ids that came back not found (or forbidden), with when to stop believing that
+missing = OrderedDict()
+MISSING_TTL = 30
+
+# Full Messages fetched for get_msg callers, kept briefly so a command that looks the same
+# message up several times fetches it once
+fetched = OrderedDict()
+FETCHED_TTL = 60
+FETCHED_MAXSIZE = 100
+
+# One shared fetch per message id, so concurrent chain walks do not each hit the API
+_inflight = {}
+
+
+class MessageRecord:
+    """
+    The parts of a message the bot reads back later. A discord.Message keeps its author
+    and member objects, reactions, components and the connection state alive; a cached
+    record takes a third to two fifths of the memory, so the fetch cache holds 2.5-3x as many.
+    reference_channel_id is the channel of the referenced message, which is not always this one.
+    """
+
+    __slots__ = ("id", "author_id", "author_bot", "content", "created_at", "reference_id",
+                 "reference_channel_id", "attachment_urls", "embed_image_urls", "channel_id", "guild_id")
+
+    def __init__(self, id, author_id, author_bot, content, created_at, reference_id, reference_channel_id,
+                 attachment_urls, embed_image_urls, channel_id, guild_id):
+        self.id = id
+        self.author_id = author_id
+        self.author_bot = author_bot
+        self.content = content
+        self.created_at = created_at
+        self.reference_id = reference_id
+        self.reference_channel_id = reference_channel_id
+        self.attachment_urls = attachment_urls
+        self.embed_image_urls = embed_image_urls
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+
+    @classmethod
+    def from_message(cls, msg):
+        ref = msg.reference
+        reference_id = ref.message_id if ref else None
+        reference_channel_id = (ref.channel_id or msg.channel.id) if reference_id else None
+        embed_image_urls = []
+        for embed in msg.embeds:
+            # main embed image
+            if embed.image and embed.image.url:
+                embed_image_urls.append(embed.image.url)
+            # thumbnail
+            if embed.thumbnail and embed.thumbnail.url:
+                embed_image_urls.append(embed.thumbnail.url)
+        return cls(msg.id, msg.author.id, msg.author.bot, msg.content, msg.created_at, reference_id,
+                   reference_channel_id, tuple(att.url for att in msg.attachments), tuple(embed_image_urls),
+                   msg.channel.id, msg.guild.id if msg.guild else None)
+
+    def __repr__(self):
+        return f"<MessageRecord id={self.id} author_id={self.author_id} channel_id={self.channel_id}>"
+
+
+def index_message(message):
+    message_index[message.id] = message
+    message_index.move_to_end(message.id)
+    if len(message_index) > INDEX_MAXSIZE:
+        message_index.popitem(last=False)
 
-def add_to_cache(obj):
-    key = obj.id
-    cache[key] = obj
+def forget_message(message_id):
+    message_index.pop(message_id, None)
+    cache.pop(message_id, None)
+    fetched.pop(message_id, None)
+    mark_missing(message_id)
+
+def mark_missing(message_id):
+    missing[message_id] = time.monotonic() + MISSING_TTL
+    missing.move_to_end(message_id)
+    if len(missing) > MISSING_MAXSIZE:
+        missing.popitem(last=False)
+
+def is_missing(message_id):
+    expires = missing.get(message_id)
+    if expires is None:
+        return False
+    if expires < time.monotonic():
+        del missing[message_id]
+        return False
+    return True
+
+def add_to_cache(msg):
+    record = MessageRecord.from_message(msg)
+    cache[record.id] = (record, time.monotonic() + CACHE_TTL)
+    cache.move_to_end(record.id)
     if len(cache) > MAXSIZE:
         cache.popitem(last=False)
+    return record
+
+def get_cached_record(message_id):
+    # Gateway messages first
+    msg = message_index.get(message_id)
+    if msg:
+        return MessageRecord.from_message(msg)
+    # Then messages we fetched, while they are fresh
+    entry = cache.get(message_id)
+    if entry is None:
+        return None
+    record, expires = entry
+    if expires < time.monotonic():
+        del cache[message_id]
+        return None
+    cache.move_to_end(message_id)
+    return record
+
+async def _on_message(message):
+    index_message(message)
+
+async def _on_raw_message_edit(payload):
+    cache.pop(payload.message_id, None)
+    fetched.pop(payload.message_id, None)
+    if payload.message is not None:
+        index_message(payload.message)
+    else:
+        message_index.pop(payload.message_id, None)
+
+async def _on_raw_message_delete(payload):
+    forget_message(payload.message_id)
+
+async def _on_raw_bulk_message_delete(payload):
+    for message_id in payload.message_ids:
+        forget_message(message_id)
+
+def install_message_index(bot):
+    """
+    Keep message_index and the fetch cache in step with the gateway. Call once per bot.
+    """
+    bot.add_listener(_on_message, "on_message")
+    bot.add_listener(_on_raw_message_edit, "on_raw_message_edit")
+    bot.add_listener(_on_raw_message_delete, "on_raw_message_delete")
+    bot.add_listener(_on_raw_bulk_message_delete, "on_raw_bulk_message_delete")
 
 async def get_msg(bot, channel, message_id):
-    # Check bot's cache first
-    msg = discord.utils.get(bot.cached_messages, id=message_id)
+    """
+    Return a full discord.Message, for callers that reply to or edit it, or None.
+    Gateway messages come from the index; anything else is fetched and kept for FETCHED_TTL.
+    """
+    msg = message_index.get(message_id)
     if msg:
         return msg
-    # Then our cache
-    if message_id in cache:
-        msg = cache[message_id]
-        return msg
-    # Else fetch from channel
+    entry = fetched.get(message_id)
+    if entry is not None:
+        msg, expires = entry
+        if expires >= time.monotonic():
+            fetched.move_to_end(message_id)
+            return msg
+        del fetched[message_id]
+    if is_missing(message_id):
+        return None
+    msg = await _shared_fetch(channel, message_id, 0)
+    if msg is not None:
+        fetched[message_id] = (msg, time.monotonic() + FETCHED_TTL)
+        fetched.move_to_end(message_id)
+        if len(fetched) > FETCHED_MAXSIZE:
+            fetched.popitem(last=False)
+    return msg
+
+async def get_record(bot, channel, message_id, window=0):
+    """
+    Return a MessageRecord from the caches or the API, or None. With window > 1 a miss is
+    fetched together with the window - 1 messages before it, which are cached for later lookups.
+    """
+    record = get_cached_record(message_id)
+    if record:
+        return record
+    if is_missing(message_id):
+        return None
+    msg = await _shared_fetch(channel, message_id, window)
+    return MessageRecord.from_message(msg) if msg else None
+
+async def _shared_fetch(channel, message_id, window):
+    # Fetch from channel, joining a fetch of the same id that is already in flight
+    future = _inflight.get(message_id)
+    if future is None:
+        fetch = _fetch_window(channel, message_id, window) if window > 1 else _fetch_msg(channel, message_id)
+        future = asyncio.ensure_future(fetch)
+        _inflight[message_id] = future
+        future.add_done_callback(lambda _: _inflight.pop(message_id, None))
+    # shield: one caller being cancelled must not cancel the fetch the others are waiting on
+    return await asyncio.shield(future)
+
+async def _fetch_window(channel, message_id, size):
+    found = None
+    try:
+        async for msg in channel.history(limit=size, before=discord.Object(id=message_id + 1)):
+            add_to_cache(msg)
+            if msg.id == message_id:
+                found = msg
+    except Exception as e:
+        logger.error(f"Error fetching history before message {message_id}: {e}")
+    # not in the window (deleted, or in another channel): ask for it directly
+    return found or await _fetch_msg(channel, message_id)
+
+async def get_reply_chain(bot, message, max_depth):
+    """
+    Follow replies from message back to the start of the conversation, newest first,
+    returning at most max_depth MessageRecords. For each hop the first source that has the
+    parent wins: the index or fresh cache (kept current by edit events), the parent the API
+    sent along as reference.resolved, then a history window fetched around the parent.
+    References into other channels are fetched through a PartialMessageable.
+    """
+    record = MessageRecord.from_message(message)
+    chain = [record]
+    # the Message behind chain[-1], when there is one, for its reference.resolved
+    current = message
+    while len(chain) < max_depth and record.reference_id:
+        parent_id = record.reference_id
+        parent = get_cached_record(parent_id)
+        parent_msg = message_index.get(parent_id)
+        resolved = current.reference.resolved if current is not None else None
+        if parent is None and isinstance(resolved, discord.Message):
+            parent, parent_msg = add_to_cache(resolved), resolved
+        elif parent is None and resolved is not None:
+            # DeletedReferencedMessage
+            mark_missing(parent_id)
+            break
+        if parent is None:
+            if is_missing(parent_id):
+                break
+            if record.reference_channel_id == message.channel.id:
+                channel = message.channel
+            else:
+                channel = bot.get_partial_messageable(record.reference_channel_id, guild_id=record.guild_id)
+            parent_msg = await _shared_fetch(channel, parent_id, CHAIN_HISTORY_WINDOW)
+            if parent_msg is None:
+                break
+            parent = MessageRecord.from_message(parent_msg)
+        chain.append(parent)
+        record, current = parent, parent_msg
+    return chain
+
+async def _fetch_msg(channel, message_id):
     try:
         msg = await channel.fetch_message(message_id)
-        add_to_cache(msg)
-        return msg
+    except (discord.NotFound, discord.Forbidden) as e:
+        mark_missing(message_id)
+        logger.error(f"Error fetching message {message_id}: {e}")
+        return None
     except Exception as e:
+        # rate limits and server errors are transient, so they are not remembered
         logger.error(f"Error fetching message {message_id}: {e}")
         return None
+    add_to_cache(msg)
+    return msg
 
 async def reply_split(message, reply_text="", image_b64=None):
+    """
+    Reply with reply_text, split into 1950-character messages, and the image on the last one.
+    Returns the messages sent.
+    """
     if not reply_text.strip() and not image_b64:
         await message.reply("Error: Empty response")
-        return
+        return []
     if len(reply_text) <= 1950:
         if image_b64:
             img_bytes = base64.b64decode(image_b64)
-            await message.reply(reply_text, file=discord.File(io.BytesIO(img_bytes), filename="image.png"))
+            return [await message.reply(reply_text, file=discord.File(io.BytesIO(img_bytes), filename="image.png"))]
         else:
-            await message.reply(reply_text)
+            return [await message.reply(reply_text)]
     else:
+        sent = []
         num_chunks = math.ceil(len(reply_text) / 1950)
         last_msg = message
         for i in range(num_chunks):
             chunk = reply_text[i*1950:(i+1)*1950]
             if i == num_chunks - 1 and image_b64:
                 img_bytes = base64.b64decode(image_b64)
-                await last_msg.reply(chunk, file=discord.File(io.BytesIO(img_bytes), filename="image.png"))
+                last_msg = await last_msg.reply(chunk, file=discord.File(io.BytesIO(img_bytes), filename="image.png"))
             else:
                 last_msg = await last_msg.reply(chunk)
+            sent.append(last_msg)
+        return sent
+
+
+class StreamingReply:
+    """
+    Shows a reply while it is being generated. The first message is posted as soon as there is
+    text, then edited at most once every interval seconds (Discord allows about five edits per
+    five seconds per channel), rolling over into a new reply every 1950 characters like reply_split.
+    """
+
+    def __init__(self, message, prefix="", interval=STREAM_EDIT_INTERVAL):
+        self.message = message
+        self.prefix = prefix or ""
+        self.interval = interval
+        self.text = ""
+        self.sent = []
+        self._shown = []
+        self._dirty = asyncio.Event()
+        self._stopped = asyncio.Event()
+        self._task = None
+        self._start = time.perf_counter()
+
+    def feed(self, delta):
+        """
+        Add generated text; called from the stream, so it never waits on Discord.
+        """
+        self.text += delta
+        self._dirty.set()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def reset(self):
+        """
+        Start over, e.g. when a request is retried; the messages already posted are reused.
+        """
+        self.text = ""
+
+    async def _run(self):
+        while not self._stopped.is_set():
+            await self._dirty.wait()
+            self._dirty.clear()
+            if self._stopped.is_set() or not (self.prefix + self.text).strip():
+                continue
+            try:
+                await self._sync(self.prefix + self.text)
+            except Exception as e:
+                logger.error(f"Error updating streamed reply: {e}")
+            try:
+                await asyncio.wait_for(self._stopped.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def close(self):
+        """
+        Stop the edit loop, letting an edit or reply already in flight complete so that every
+        posted message is tracked in sent. Safe to call more than once.
+        """
+        self._stopped.set()
+        self._dirty.set()
+        if self._task is not None:
+            await self._task
+
+    async def _sync(self, text, file=None):
+        # an image-only reply still needs one (empty) message to carry the file
+        chunks = [text[i:i + 1950] for i in range(0, len(text), 1950)] or [""]
+        for i, chunk in enumerate(chunks):
+            last = i == len(chunks) - 1
+            if i < len(self.sent):
+                if self._shown[i] != chunk or (last and file):
+                    await self.sent[i].edit(content=chunk, **({"attachments": [file]} if last and file else {}))
+            else:
+                target = self.sent[-1] if self.sent else self.message
+                self.sent.append(await target.reply(chunk, **({"file": file} if last and file else {})))
+                if len(self.sent) == 1:
+                    reply_latency.record("first_text_streamed", self._start)
+            if i < len(self._shown):
+                self._shown[i] = chunk
+            else:
+                self._shown.append(chunk)
+        # the final text can be shorter than what was streamed (a retry, or text before a tool call)
+        while len(self.sent) > len(chunks):
+            self._shown.pop()
+            await self.sent.pop().delete()
 
+    async def finish(self, reply_text="", image_b64=None):
+        """
+        Replace the streamed text with the final reply, attach the image to the last message,
+        and return the messages that make up the reply.
+        """
+        await self.close()
+        text = self.prefix + reply_text
+        if not text.strip() and not image_b64:
+            text = "Error: Empty response"
+        file = discord.File(io.BytesIO(base64.b64decode(image_b64)), filename="image.png") if image_b64 else None
+        await self._sync(text, file)
+        return self.sent
@@ -0,0 +1,135 @@
+import base64
+import io
+import logging
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+from PIL import Image, ImageOps
+
+from config import IMAGE_CACHE_BYTES, IMAGE_MAX_SIDE, IMAGE_FORMAT, IMAGE_QUALITY
+
+logger = logging.getLogger(__name__)
+
+# Formats the model accepts as they are; anything else is always re-encoded
+PASSTHROUGH_MIME_TYPES = {"image/jpeg", "image/png", "image/webp"}
+
+
+# Hosts that serve Discord attachments under /attachments/<channel id>/<attachment id>/<filename>
+DISCORD_CDN_HOSTS = {"cdn.discordapp.com", "media.discordapp.net"}
+
+
+def cache_key(url):
+    """
+    Discord signs attachment links with query parameters that change between fetches of the
+    same message, but the path does not, so those are keyed without the query. Any other URL
+    is keyed as it is; its query can select a different image.
+    """
+    parts = urlsplit(url)
+    if parts.hostname in DISCORD_CDN_HOSTS and parts.path.startswith("/attachments/"):
+        return parts.hostname + parts.path
+    return url
+
+
+def downscale(data, mime_type, max_side=IMAGE_MAX_SIDE, fmt=IMAGE_FORMAT, quality=IMAGE_QUALITY):
+    """
+    Shrink an image to fit max_side x max_side and re-encode it as fmt. Returns (bytes, mime type);
+    the original is returned when it is already small enough and re-encoding would not make it smaller.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        fits = max(image.size) <= max_side
+        if fits and mime_type in PASSTHROUGH_MIME_TYPES:
+            return data, mime_type
+        if not fits:
+            image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        out_fmt = fmt
+        if fmt == "JPEG":
+            if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+                # JPEG has no alpha channel
+                out_fmt = "PNG"
+            elif image.mode != "RGB":
+                image = image.convert("RGB")
+        buf = io.BytesIO()
+        # optimize is cheap for JPEG but triples PNG encode time for a percent or two
+        image.save(buf, format=out_fmt, quality=quality, optimize=out_fmt == "JPEG")
+    out = buf.getvalue()
+    if fits and len(out) >= len(data) and mime_type in PASSTHROUGH_MIME_TYPES:
+        return data, mime_type
+    return out, Image.MIME[out_fmt]
+
+
+def to_data_uri(data, mime_type):
+    """
+    Downscale an image and encode it as a base64 data URI. CPU-bound; run it in a thread.
+    """
+    try:
+        data_out, mime_out = downscale(data, mime_type)
+    except Exception as e:
+        # not something Pillow can read; let the model decide what to do with it
+        logger.warning(f"Could not downscale {mime_type} image: {e}")
+        data_out, mime_out = data, mime_type
+    return f"data:{mime_out};base64,{base64.b64encode(data_out).decode('utf-8')}", len(data_out)
+
+
+class ImageCache:
+    """
+    LRU of prepared image data URIs by cache_key(url), bounded by the total size of the URIs.
+
+    A follow-up turn in a reply chain sends the same images again; a hit skips both the
+    download and the downscale.
+    """
+
+    def __init__(self, max_bytes=IMAGE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes_downloaded = 0
+        self.bytes_sent = 0
+        self.bytes_not_downloaded = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        data_uri, raw_size = entry
+        self.bytes_not_downloaded += raw_size
+        return data_uri
+
+    def put(self, key, data_uri, raw_size, prepared_size):
+        self.bytes_downloaded += raw_size
+        self.bytes_sent += prepared_size
+        if len(data_uri) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old[0])
+        self._entries[key] = (data_uri, raw_size)
+        self.size += len(data_uri)
+        while self.size > self.max_bytes:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "bytes_saved_downscaling": self.bytes_downloaded - self.bytes_sent,
+            "bytes_not_downloaded": self.bytes_not_downloaded,
+        }
+
+
+image_cache = ImageCache()
@@ -0,0 +1,65 @@
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _build_trie(phrases):
+    root = {}
+    for phrase in phrases:
+        node = root
+        for ch in phrase:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+    return root
+
+
+def _trie_pattern(node):
+    # "" marks the end of a phrase; making the longer continuation optional keeps matches longest-first
+    branches = [re.escape(ch) + _trie_pattern(child) for ch, child in sorted(node.items()) if ch]
+    if not branches:
+        return ""
+    body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    return "(?:" + body + ")?" if "" in node else body
+
+
+class PhraseMatcher:
+    """
+    Case-insensitive substring matcher for a list of phrases.
+
+    The phrases are compiled into one trie-shaped regex, so a message is lowercased and
+    scanned once no matter how many phrases there are. compile() can be called again at
+    any time to swap in a new list; the old pattern keeps serving until the new one is ready.
+    """
+
+    def __init__(self, phrases=()):
+        self.phrases = []
+        self._pattern = None
+        self.compile(phrases)
+
+    def compile(self, phrases):
+        phrases = sorted({phrase.lower() for phrase in phrases if phrase})
+        pattern = re.compile(_trie_pattern(_build_trie(phrases))) if phrases else None
+        self.phrases, self._pattern = phrases, pattern
+        logger.info(f"Compiled {len(phrases)} phrases")
+
+    def search(self, text):
+        """
+        Return the first phrase found in text, or None.
+        """
+        if self._pattern is None:
+            return None
+        match = self._pattern.search(text.lower())
+        return match.group() if match else None
+
+    def find_all(self, text):
+        """
+        Return every distinct phrase found in text, in order of first appearance.
+        """
+        if self._pattern is None:
+            return []
+        found = self._pattern.findall(text.lower())
+        return list(dict.fromkeys(found)) if found else found
+
+    def __len__(self):
+        return len(self.phrases)
@@ -1,3 +1,4 @@
+import asyncio
 import base64
 import functools
 import json
@@ -6,19 +7,23 @@ import os
 from io import BytesIO
 
 import aiohttp
-import requests
 import logging
-from openai import OpenAI
 from config import OPENAI_API_KEY, DEFAULT_MODEL_ENGINE, DEFAULT_TEMPERATURE, DEFAULT_FREQ_PENALTY, \
     DEFAULT_PRES_PENALTY, DEFAULT_TOP_P
-from db import update_usage, get_description, set_description, set_name, get_name
+from db import aupdate_usage, set_description, set_name, get_name, run_write
 from utils import run_async, truncate_long_values
 
-client = OpenAI(
-    api_key=OPENAI_API_KEY
-)
 logger = logging.getLogger(__name__)
 
+
+@functools.cache
+def get_client():
+    # openai takes about a second to import, so it is loaded on first use rather than at startup
+    from openai import OpenAI
+    return OpenAI(
+        api_key=OPENAI_API_KEY
+    )
+
 tools = [
     {
         "type": "function",
@@ -203,12 +208,57 @@ def call_function(name, args):
         return {"error": f"Unknown function call: {name}"}
 
 
+async def stream_response(request_kwargs, on_delta):
+    """
+    Run a streaming Responses API request, calling on_delta(text) for each piece of output
+    text as it arrives, and return the completed response.
+    """
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+
+    # the client is synchronous, so the stream is read on a worker thread and handed over event by event
+    def produce():
+        try:
+            with get_client().responses.create(stream=True, **request_kwargs) as stream:
+                for event in stream:
+                    loop.call_soon_threadsafe(events.put_nowait, event)
+        except Exception as e:
+            loop.call_soon_threadsafe(events.put_nowait, e)
+        loop.call_soon_threadsafe(events.put_nowait, None)
+
+    producer = loop.run_in_executor(None, produce)
+    response = None
+    while (event := await events.get()) is not None:
+        if isinstance(event, Exception):
+            raise event
+        if event.type == "response.output_text.delta":
+            on_delta(event.delta)
+        elif event.type in ("response.completed", "response.incomplete"):
+            response = event.response
+        elif event.type == "response.failed":
+            raise RuntimeError(event.response.error.message if event.response.error else "response failed")
+        elif event.type == "error":
+            raise RuntimeError(event.message)
+    await producer
+    if response is None:
+        raise RuntimeError("stream ended without a response")
+    return response
+
+
 async def get_chat_response(messages,
                             user_id,
                             model_engine=DEFAULT_MODEL_ENGINE,
                             temperature=DEFAULT_TEMPERATURE,
                             top_p=DEFAULT_TOP_P,
-                            previous_response_id=None):
+                            previous_response_id=None,
+                            on_delta=None):
+    """
+    Run a Responses API request, executing any function calls it makes, and return
+    (text, image_b64, response_id). response_id is None when the request failed, so a
+    caller continuing from previous_response_id can fall back to sending the full prompt.
+    With on_delta the response is streamed and on_delta(text) is called with each piece of
+    text as it arrives, across all function-call rounds; the return value is the same.
+    """
     logger.info(f"Getting chat response with model {model_engine} \n messages: {truncate_long_values(messages)} \n")
     try:
         while True:
@@ -227,19 +277,24 @@ async def get_chat_response(messages,
             )
             if previous_response_id:
                 request_kwargs["previous_response_id"] = previous_response_id
-            response = await run_async(
-                functools.partial(
-                    client.responses.create,
-                    **request_kwargs
+                # the stored conversation is not trimmed on our side, so let the API drop its oldest turns
+                request_kwargs["truncation"] = "auto"
+            if on_delta:
+                response = await stream_response(request_kwargs, on_delta)
+            else:
+                response = await run_async(
+                    functools.partial(
+                        get_client().responses.create,
+                        **request_kwargs
+                    )
                 )
-            )
 
             # billing
             input_tokens = response.usage.input_tokens
             output_tokens = response.usage.output_tokens
             cost = pricing[model_engine]["input"] * input_tokens \
                    + pricing[model_engine]["output"] * output_tokens
-            update_usage(user_id, cost)
+            await aupdate_usage(user_id, cost)
             logger.info(f"Usage: {response.usage}, Cost: {cost:.4f} USD")
 
             # image generation
@@ -250,36 +305,39 @@ async def get_chat_response(messages,
             ]
             image_data = [output.result for output in image_generation_calls]
             if image_data:
-                update_usage(user_id,
-                             pricing["gpt-image-1"]["medium"] + (pricing["gpt-image-1"]["output"] * output_tokens))
+                await aupdate_usage(user_id,
+                                    pricing["gpt-image-1"]["medium"] + (pricing["gpt-image-1"]["output"] * output_tokens))
 
             # function calls
             if not any(out.type == "function_call" for out in response.output):
-                return response.output_text, image_data[0] if image_data else None
+                return response.output_text, image_data[0] if image_data else None, response.id
 
-            # for each function call, execute and append a function result
+            # for each function call, execute and send back a function result; the calls
+            # themselves are already stored with the response, so only the results are sent
+            messages = []
             for tool_call in response.output:
                 if tool_call.type != "function_call":
                     continue
                 name = tool_call.name
                 args = json.loads(tool_call.arguments)
-                result = call_function(name, args)
+                # tool calls touch the identities table, so they run on the db writer thread
+                result = await run_write(call_function, name, args)
 
-                messages.append(tool_call)
                 messages.append({
                     "type": "function_call_output",
                     "call_id": tool_call.call_id,
                     "output": str(result)
                 })
+            previous_response_id = response.id
             #
     except Exception as e:
         logger.error(f"Error getting chat response: {e}")
-        return f"Error: {str(e)}", None
+        return f"Error: {str(e)}", None, None
 
 
 async def get_tts(text, model, user_id, voice="onyx"):
     try:
-        response = client.audio.speech.create(
+        response = get_client().audio.speech.create(
             model=model,
             voice=voice,
             input=text
@@ -303,7 +361,7 @@ async def get_image(model, prompt, user_id, n, size, quality):
             raise ValueError("DALL-E 3 only supports n=1")
         # todo write checks for quality congruence with model
         response = await run_async(
-            client.images.generate,
+            get_client().images.generate,
             model=model, prompt=prompt, n=n, size=size, quality=quality, moderation="low"
         )
         if model == "gpt-image-1":
@@ -314,7 +372,7 @@ async def get_image(model, prompt, user_id, n, size, quality):
             total_cost = 0.0
             logging.error(f"Unknown model {model} for image generation succeeded in image generation")
         logger.info(f"Image generation cost: {total_cost}")
-        update_usage(user_id, total_cost)
+        await aupdate_usage(user_id, total_cost)
 
         return response
     except Exception as e:
@@ -340,12 +398,12 @@ async def edit_image(prompt, user_id, image_urls):
                 images.append((filename, buf, mime_type))
 
         response = await run_async(
-            client.images.edit,
+            get_client().images.edit,
             model="gpt-image-1", prompt=prompt, image=images
         )
         total_cost = pricing["gpt-image-1"]["high"]
         logger.info(f"Image editing cost: {total_cost}")
-        update_usage(user_id, total_cost)
+        await aupdate_usage(user_id, total_cost)
 
         return response
     except Exception as e:
@@ -0,0 +1,40 @@
+import time
+from collections import defaultdict
+
+
+class LatencyStats:
+    """
+    Count, mean and max of short timings, grouped by label.
+    """
+
+    def __init__(self):
+        self._count = defaultdict(int)
+        self._total = defaultdict(float)
+        self._max = defaultdict(float)
+
+    def record(self, label, start):
+        """
+        Record the time elapsed since start (a time.perf_counter() value) under label.
+        """
+        elapsed = time.perf_counter() - start
+        self._count[label] += 1
+        self._total[label] += elapsed
+        if elapsed > self._max[label]:
+            self._max[label] = elapsed
+
+    def stats(self):
+        return {
+            label: {
+                "count": count,
+                "avg_us": round(self._total[label] / count * 1e6, 1),
+                "max_us": round(self._max[label] * 1e6, 1),
+            }
+            for label, count in self._count.items()
+        }
+
+
+# Time on_message spends deciding where a message goes, by route
+message_routing = LatencyStats()
+
+# Time from starting on a prompt until the first reply text is visible, streamed or not
+reply_latency = LatencyStats()
@@ -16,6 +16,15 @@ def load_static_config():
 
 static_config = load_static_config()
 
+
+def reload_static_config():
+    """
+    Re-read static_config.json in place, so every module holding static_config sees the new values.
+    """
+    fresh = load_static_config()
+    static_config.clear()
+    static_config.update(fresh)
+
 def get_personality(guild_id, message_list):
     # old bot used different personalities per server but no need for that right now except for test server
     if guild_id == TEST_SERVER_ID:
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import time
+from collections import Counter, OrderedDict
+
+from config import REACTION_FLUSH_INTERVAL, REACTION_FLUSH_MAX_EVENTS, REACTION_AUTHOR_INDEX_SIZE
+from db import aapply_reaction_batch
+
+logger = logging.getLogger(__name__)
+
+
+class ReactionBuffer:
+    """
+    Write-behind buffer for karma and reaction events.
+
+    Events are coalesced in memory (karma per (guild, user), reaction rows per
+    (message, reactor, emoji) where the last add/remove wins) and committed in a
+    single transaction once flush_interval seconds have passed since the first
+    pending event or max_events have been queued, whichever comes first.
+
+    It also remembers the author of recently reacted messages, so a removal can be
+    attributed without asking Discord even before the matching add has been flushed.
+    """
+
+    def __init__(self, flush_interval=REACTION_FLUSH_INTERVAL, max_events=REACTION_FLUSH_MAX_EVENTS,
+                 author_index_size=REACTION_AUTHOR_INDEX_SIZE):
+        self.flush_interval = flush_interval
+        self.max_events = max_events
+        self.author_index_size = author_index_size
+        self._authors = OrderedDict()
+        self.author_lookups = Counter()
+        self._karma = {}
+        self._reactions = {}
+        self._depth = 0
+        self._pending = asyncio.Event()
+        self._full = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._closing = False
+        self.flushes = 0
+        self.events_flushed = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._closing = False
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        """
+        Stop the flush loop and commit everything still queued.
+        """
+        if self._task is not None:
+            # wake the loop and let it exit on its own; cancelling it can be swallowed by
+            # wait_for on Python < 3.12 when the wait completes at the same moment
+            self._closing = True
+            self._pending.set()
+            self._full.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def remember_author(self, message_id, author_id):
+        self._authors[message_id] = author_id
+        self._authors.move_to_end(message_id)
+        if len(self._authors) > self.author_index_size:
+            self._authors.popitem(last=False)
+
+    def author_of(self, message_id):
+        author_id = self._authors.get(message_id)
+        if author_id is not None:
+            self._authors.move_to_end(message_id)
+        return author_id
+
+    def add(self, guild_id, channel_id, message_id, reactor_id, reactee_id, value, delta):
+        self.remember_author(message_id, reactee_id)
+        self._enqueue(guild_id, reactee_id, delta, (message_id, reactor_id, str(value)),
+                      (guild_id, channel_id, reactee_id))
+
+    def remove(self, guild_id, message_id, reactor_id, reactee_id, value, delta):
+        self._enqueue(guild_id, reactee_id, delta, (message_id, reactor_id, str(value)), None)
+
+    def _enqueue(self, guild_id, user_id, delta, reaction_key, reaction):
+        karma_key = (guild_id, user_id)
+        self._karma[karma_key] = self._karma.get(karma_key, 0) + delta
+        # (guild_id, channel_id, reactee_id) for an add, None for a removal
+        self._reactions[reaction_key] = reaction
+        self._depth += 1
+        self._pending.set()
+        if self._depth >= self.max_events:
+            self._full.set()
+
+    async def _run(self):
+        while not self._closing:
+            await self._pending.wait()
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self):
+        async with self._flush_lock:
+            self._pending.clear()
+            self._full.clear()
+            if not self._depth:
+                return
+            karma, reactions, depth = self._karma, self._reactions, self._depth
+            self._karma, self._reactions, self._depth = {}, {}, 0
+
+            karma_deltas = [(guild_id, user_id, delta) for (guild_id, user_id), delta in karma.items() if delta]
+            added, removed = [], []
+            for (message_id, reactor_id, value), reaction in reactions.items():
+                if reaction is None:
+                    removed.append((message_id, reactor_id, value))
+                else:
+                    guild_id, channel_id, reactee_id = reaction
+                    added.append((guild_id, channel_id, message_id, reactor_id, reactee_id, value))
+
+            start = time.perf_counter()
+            try:
+                await aapply_reaction_batch(karma_deltas, added, removed)
+            except Exception as e:
+                logger.error(f"Error flushing {depth} reaction events, requeueing: {e}")
+                self._requeue(karma, reactions, depth)
+                return
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.flushes += 1
+            self.events_flushed += depth
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self._total_flush_ms += elapsed_ms
+
+    def _requeue(self, karma, reactions, depth):
+        for key, delta in karma.items():
+            self._karma[key] = self._karma.get(key, 0) + delta
+        for key, reaction in reactions.items():
+            # anything queued while the failed flush was running is newer
+            self._reactions.setdefault(key, reaction)
+        self._depth += depth
+        self._pending.set()
+
+    def stats(self):
+        return {
+            "queue_depth": self._depth,
+            "flushes": self.flushes,
+            "events_flushed": self.events_flushed,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_ms": round(self._total_flush_ms / self.flushes, 2) if self.flushes else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 2),
+            "author_index_size": len(self._authors),
+            "author_lookups": dict(self.author_lookups),
+        }
+
+
+reaction_buffer = ReactionBuffer()
@@ -2,6 +2,8 @@ import time
 import random
 import logging
 
+from matcher import PhraseMatcher
+
 logger = logging.getLogger(__name__)
 
 # Define alarming phrases for crisis response
@@ -13,6 +15,19 @@ ALARMING_WORDS = [
     "stab myself", "im gonna jump", "blow myself up", "i wish for the sweet release of death"
 ]
 
+alarming_words = PhraseMatcher()
+
+
+def reload_alarming_words():
+    """
+    Recompile the alarming-words matcher from ALARMING_WORDS plus static_config["alarming_words"].
+    """
+    from personality import static_config
+    alarming_words.compile(ALARMING_WORDS + static_config.get("alarming_words", []))
+
+
+reload_alarming_words()
+
 # Global variable to track the last time an insult was sent.
 last_insult_date = 0
 
@@ -0,0 +1,186 @@
+import asyncio
+import datetime
+import logging
+import random
+import time
+
+import pytz
+
+from db import aget_meta, acompare_and_set_meta
+
+logger = logging.getLogger(__name__)
+
+# Long waits are slept in chunks of at most this many seconds and re-measured against
+# the wall clock, so suspend/resume or clock corrections cannot make a job late.
+MAX_SLEEP = 3600
+# How long to wait before trying again when the database could not be read or written
+RETRY_DELAY = 60
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class Daily:
+    """
+    Every day at hour:minute in tz (a pytz timezone).
+    """
+
+    def __init__(self, hour=0, minute=0, tz=None):
+        self.at = datetime.time(hour, minute)
+        self.tz = tz
+
+    def next_after(self, moment):
+        tz = self.tz or pytz.utc
+        day = moment.astimezone(tz).date()
+        candidate = tz.localize(datetime.datetime.combine(day, self.at))
+        if candidate <= moment:
+            candidate = tz.localize(datetime.datetime.combine(day + datetime.timedelta(days=1), self.at))
+        return candidate
+
+    def __str__(self):
+        return f"daily at {self.at:%H:%M} {self.tz or 'UTC'}"
+
+
+class Every:
+    """
+    A fixed interval after the previous run.
+    """
+
+    def __init__(self, seconds):
+        self.interval = datetime.timedelta(seconds=seconds)
+
+    def next_after(self, moment):
+        return moment + self.interval
+
+    def __str__(self):
+        return f"every {self.interval}"
+
+
+class Job:
+    def __init__(self, name, schedule, func, jitter=0):
+        self.name = name
+        self.schedule = schedule
+        self.func = func
+        self.jitter = jitter
+        self.lock = asyncio.Lock()
+        self.next_run = None
+        self.runs = 0
+        self.failures = 0
+        self.last_duration_ms = 0.0
+
+    @property
+    def meta_key(self):
+        return f"job_last_run:{self.name}"
+
+
+class Scheduler:
+    """
+    Runs registered async jobs at their next deadline.
+
+    Each job has one runner task that sleeps exactly until the next deadline (plus up to
+    `jitter` random seconds) and holds the job's lock while it runs, so a job never overlaps
+    itself. The last run is stored in the meta table and claimed with a compare-and-set
+    before running, so a restart does not re-run a job and a second bot process cannot run
+    the same deadline twice. Deadlines missed while the bot was down run once on startup.
+    """
+
+    def __init__(self):
+        self.jobs = {}
+        self._tasks = {}
+        self._running = False
+
+    def register(self, name, schedule, func, jitter=0):
+        """
+        Add or replace a job; a cog that is reloaded simply registers its jobs again.
+        """
+        if name in self._tasks:
+            self._tasks.pop(name).cancel()
+        job = self.jobs[name] = Job(name, schedule, func, jitter)
+        if self._running:
+            self._tasks[name] = asyncio.create_task(self._run(job))
+        return job
+
+    def job(self, name, schedule, jitter=0):
+        """
+        Decorator form of register().
+        """
+        def decorator(func):
+            self.register(name, schedule, func, jitter)
+            return func
+        return decorator
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        for name, job in self.jobs.items():
+            self._tasks[name] = asyncio.create_task(self._run(job))
+
+    async def close(self):
+        self._running = False
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, job):
+        while True:
+            try:
+                last = await aget_meta(job.meta_key)
+                now = _now()
+                deadline = job.schedule.next_after(datetime.datetime.fromisoformat(last) if last else now)
+                job.next_run = deadline
+                await self._sleep_until(deadline + datetime.timedelta(seconds=random.uniform(0, job.jitter)))
+                # a deadline missed while the bot was down is recorded as now, so several missed days run once
+                claimed = now if deadline <= now else deadline
+                if not await acompare_and_set_meta(job.meta_key, last, claimed.isoformat()):
+                    logger.info(f"Job {job.name} was already run for {claimed.isoformat()}, skipping")
+                    continue
+            except Exception as e:
+                # the runner must outlive a locked or unreadable database, or the job never runs again
+                logger.error(f"Error scheduling job {job.name}, retrying in {RETRY_DELAY}s: {e}")
+                await asyncio.sleep(RETRY_DELAY)
+                continue
+            await self.run_now(job.name)
+
+    @staticmethod
+    async def _sleep_until(when):
+        while True:
+            delay = (when - _now()).total_seconds()
+            if delay <= 0:
+                return
+            await asyncio.sleep(min(delay, MAX_SLEEP))
+
+    async def run_now(self, name):
+        """
+        Run a job immediately, waiting for any run already in progress first.
+        """
+        job = self.jobs[name]
+        async with job.lock:
+            start = time.perf_counter()
+            try:
+                await job.func()
+            except Exception as e:
+                job.failures += 1
+                logger.error(f"Job {job.name} failed: {e}")
+            else:
+                job.runs += 1
+            job.last_duration_ms = (time.perf_counter() - start) * 1000
+            logger.info(f"Job {job.name} finished in {job.last_duration_ms:.0f}ms")
+
+    def stats(self):
+        return {
+            name: {
+                "schedule": str(job.schedule),
+                "next_run": job.next_run.isoformat(timespec="seconds") if job.next_run else None,
+                "runs": job.runs,
+                "failures": job.failures,
+                "last_duration_ms": round(job.last_duration_ms, 1),
+            }
+            for name, job in self.jobs.items()
+        }
+
+
+scheduler = Scheduler()
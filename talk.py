@@ -1,91 +1,144 @@
+import asyncio
 import logging
 import re
+import time
 from commands.abbreviation import expand_abbreviations
-from config import DEFAULT_MODEL_ENGINE, DEFAULT_TEMPERATURE, DEFAULT_TOP_P, TEST_SERVER_ID
-from db import get_name, get_description, set_name
-from discord_helper import reply_split, get_msg
+from context_window import fit_turns
+from config import DEFAULT_MODEL_ENGINE, DEFAULT_TEMPERATURE, DEFAULT_TOP_P, TEST_SERVER_ID, MAX_CHAIN_DEPTH, \
+    RESPONSE_ID_TTL, STREAM_RESPONSES
+from db import aget_identities, aset_names, aget_response_id, aset_response_id
+from discord_helper import reply_split, get_reply_chain, MessageRecord, StreamingReply
 from openai_helper import get_chat_response
+from perf import reply_latency
 from personality import get_personality
-from utils import requires_credit, url_to_data_uri
-from types import SimpleNamespace
+from utils import requires_credit, urls_to_data_uris
 
 logger = logging.getLogger(__name__)
 
+PARAM_PATTERN = re.compile(r"\b(usemodel|usetemp|usetopp)\s+(\S+)", re.IGNORECASE)
+USER_ID_PATTERN = re.compile(r"<@!?(\d{17,19})>")
+# keyword in a message -> (params key, converter)
+PARAM_MAPPING = {
+    "usemodel": ("model_engine", str),
+    "usetemp": ("temperature", float),
+    "usetopp": ("top_p", float)
+}
+
+
+def extract_params(content, params):
+    """
+    Apply the usemodel/usetemp/usetopp settings in content to params and return content without them.
+    """
+    def apply(match):
+        param_name, convert_func = PARAM_MAPPING[match.group(1).lower()]
+        try:
+            params[param_name] = convert_func(match.group(2))
+        except ValueError:
+            pass
+        return ""
+    return PARAM_PATTERN.sub(apply, content)
+
+
+def compile_id_pattern(ids):
+    """
+    One alternation over the ids, longest first so that an id which is a prefix of another never wins.
+    """
+    return re.compile("|".join(sorted(ids, key=len, reverse=True)))
+
 
 @requires_credit(lambda ctx, *args, **kwargs: 0.001)
 async def handle_prompt_chain(ctx, message, bot_id, ping=None):
     """
     Collects the conversation from a reply chain, builds a prompt,
-    sends it to the AI, and replies using reply_split.
+    sends it to the AI, and replies using reply_split, or streams the
+    reply as it is generated when STREAM_RESPONSES is on.
+
+    A reply to one of the bot's own replies continues that OpenAI response by id, so only
+    the new message is sent; the whole chain is rebuilt when no usable response id is stored.
     """
     is_test_server = ctx.guild.id == TEST_SERVER_ID
-
-    chain = []
-    current = message
-    while current:
-        chain.append(current)
-        if current.reference and current.reference.message_id:
-            try:
-                current = await get_msg(ctx.bot, current.channel, current.reference.message_id)
-            except Exception:
-                break
-        else:
-            break
-    chain.reverse()  # earliest first
-
+    response_id = None
+    start = time.perf_counter()
+    stream = StreamingReply(message, prefix=ping) if STREAM_RESPONSES else None
+    on_delta = stream.feed if stream else None
+
+    try:
+        previous = None
+        if message.reference and message.reference.message_id:
+            previous = await aget_response_id(message.reference.message_id, RESPONSE_ID_TTL)
+        if previous:
+            params = {"model_engine": previous["model_engine"],
+                      "temperature": previous["temperature"],
+                      "top_p": previous["top_p"]}
+            messages_prompt = await build_messages_prompt([MessageRecord.from_message(message)], message.guild,
+                                                          bot_id, is_test_server, params, with_system=False)
+            response, image, response_id = await get_chat_response(messages_prompt,
+                                                                    model_engine=params["model_engine"],
+                                                                    temperature=params["temperature"],
+                                                                    top_p=params["top_p"],
+                                                                    user_id=message.author.id,
+                                                                    previous_response_id=previous["response_id"],
+                                                                    on_delta=on_delta)
+            if response_id is None:
+                logger.warning(f"Could not continue response {previous['response_id']}, rebuilding the reply chain")
+                if stream:
+                    stream.reset()
+
+        if response_id is None:
+            chain = await get_reply_chain(ctx.bot, message, MAX_CHAIN_DEPTH)
+            chain.reverse()  # earliest first
+
+            params = {"model_engine": DEFAULT_MODEL_ENGINE,
+                      "temperature": DEFAULT_TEMPERATURE,
+                      "top_p": DEFAULT_TOP_P}
+            messages_prompt = await build_messages_prompt(chain, message.guild, bot_id, is_test_server, params)
+            response, image, response_id = await get_chat_response(messages_prompt,
+                                                                    model_engine=params["model_engine"],
+                                                                    temperature=params["temperature"],
+                                                                    top_p=params["top_p"],
+                                                                    user_id=message.author.id,
+                                                                    on_delta=on_delta)
+    finally:
+        if stream:
+            # the prompt or the model call can fail; the edit loop must not wait on new text forever
+            await stream.close()
+
+    if stream:
+        sent = await stream.finish(response, image)
+    else:
+        response = ping + response if ping else response
+        sent = await reply_split(message, response, image)
+        reply_latency.record("first_text_whole", start)
+    if response_id and sent:
+        await aset_response_id([reply.id for reply in sent], response_id,
+                               params["model_engine"], params["temperature"], params["top_p"])
+
+
+async def build_messages_prompt(chain, guild, bot_id, is_test_server, params, with_system=True):
+    """
+    Turn MessageRecords (earliest first) into Responses API input. Parameters given in the
+    messages (usemodel, usetemp, usetopp) are written into params, later messages winning.
+    """
     prompt_lines = []
     author_ids = [bot_id]
 
-    params = {"model_engine": DEFAULT_MODEL_ENGINE,
-              "temperature": DEFAULT_TEMPERATURE,
-              "top_p": DEFAULT_TOP_P}
-    param_pattern = re.compile(r"\b(usemodel|usetemp|usetopp)\s+(\S+)", re.IGNORECASE)
-    user_id_pattern = re.compile(r"<@!?(\d{17,19})>")
-
     for msg in chain:
         # Extract parameters from message (later messages override earlier ones)
-        for match in param_pattern.finditer(msg.content):
-            key, val = match.group(1).lower(), match.group(2)
-            param_mapping = {
-                "usemodel": ("model_engine", str),
-                "usetemp": ("temperature", float),
-                "usetopp": ("top_p", float)
-            }
-
-            if key in param_mapping:
-                param_name, convert_func = param_mapping[key]
-                try:
-                    params[param_name] = convert_func(val)
-                except ValueError:
-                    pass
-
-        clean_content = param_pattern.sub("", msg.content).strip()
+        clean_content = extract_params(msg.content, params).strip()
 
         if clean_content.startswith("!"):
             clean_content = clean_content[1:]
 
-        clean_content = expand_abbreviations(clean_content, msg.guild.id, msg.author.id)
+        clean_content = await expand_abbreviations(clean_content, msg.guild_id, msg.author_id)
         # short date line, month day hr minute
         date = msg.created_at.strftime("%b %d %H:%M")
-        prompt_lines.append(["assistant" if msg.author.id == bot_id else "user",
-                             f"{clean_content}" if is_test_server or msg.author.id == bot_id else f"({date}) {msg.author.id}: {clean_content}",
-                             list(msg.attachments)])
-
-        embed_urls = []
-        for embed in msg.embeds:
-            # main embed image
-            if embed.image and embed.image.url:
-                embed_urls.append(embed.image.url)
-            # thumbnail
-            if embed.thumbnail and embed.thumbnail.url:
-                embed_urls.append(embed.thumbnail.url)
-        for url in embed_urls:
-            prompt_lines[-1][2].append(SimpleNamespace(url=url))
+        prompt_lines.append(["assistant" if msg.author_id == bot_id else "user",
+                             f"{clean_content}" if is_test_server or msg.author_id == bot_id else f"({date}) {msg.author_id}: {clean_content}",
+                             [*msg.attachment_urls, *msg.embed_image_urls]])
 
         if not is_test_server:
-            author_ids.append(msg.author.id)
-            mentioned_ids = user_id_pattern.findall(msg.content)
-            author_ids.extend(mentioned_ids)
+            author_ids.append(msg.author_id)
+            author_ids.extend(int(user_id) for user_id in USER_ID_PATTERN.findall(msg.content))
 
     # Collapse bck-to-back bot messages
     collapsed = []
@@ -99,19 +152,18 @@ async def handle_prompt_chain(ctx, message, bot_id, ping=None):
     prompt_lines = collapsed
 
     # authors_information = {author_id: (name, description), ...}
-    authors_information = get_author_information(author_ids, message.guild)
+    authors_information = await get_author_information(author_ids, guild)
 
-    for i, line in enumerate(prompt_lines):
-        # this would seem inefficient but this is done to handle pings within messages
-        for user_id in author_ids:
-            if str(user_id) in line[1]:
-                name, _ = authors_information[user_id]
-                prompt_lines[i][1] = prompt_lines[i][1].replace(str(user_id), name)
+    # ids to names in one pass per line, covering both the "(date) id:" prefixes and pings
+    names = {str(author_id): name for author_id, (name, _) in authors_information.items()}
+    id_pattern = compile_id_pattern(names)
+    for line in prompt_lines:
+        line[1] = id_pattern.sub(lambda match: names[match.group()], line[1])
 
-    personality = get_personality(message.guild.id, prompt_lines)
+    personality = get_personality(guild.id, prompt_lines) if with_system else None
     system_msg = personality
     added_memory_section = False
-    if not is_test_server:
+    if system_msg and not is_test_server:
         system_msg += "\n\nUser IDs:\n"
         for author_id in authors_information:
             name, description = authors_information[author_id]
@@ -130,6 +182,12 @@ async def handle_prompt_chain(ctx, message, bot_id, ping=None):
          "content": system_msg}
     ] if system_msg else []
 
+    # counted off the event loop: the first use of a model's encoding may download it
+    prompt_lines, _ = await asyncio.to_thread(fit_turns, system_msg, prompt_lines, params["model_engine"])
+
+    # every image in the chain is downloaded up front, in parallel
+    data_uris = await urls_to_data_uris(url for _, _, attachments in prompt_lines for url in attachments)
+
     for role, text, attachments in prompt_lines:
         if not attachments:
             messages_prompt.append({
@@ -141,46 +199,41 @@ async def handle_prompt_chain(ctx, message, bot_id, ping=None):
                 content = [{"type": "input_text", "text": f"Gluemo (you/the assistant): {text}"}]
             else:
                 content = [{"type": "input_text", "text": text}]
-            for attachment in attachments:
-                if attachment.url:
-                    # so switching to the responses endpoint they dont support external urls so we have to download and convert to b64
+            for url in attachments:
+                # so switching to the responses endpoint they dont support external urls so we have to download and convert to b64
+                if url in data_uris:
                     content.append({
                         "type": "input_image",
-                        "image_url": await url_to_data_uri(attachment.url)
+                        "image_url": data_uris[url]
                     })
-                else:
-                    logger.warning(f"Attachment URL not found for message ID {attachment.id}")
             messages_prompt.append({
                 "role": "user",
                 "content": content
             })
 
-    response, image = await get_chat_response(messages_prompt,
-                                       model_engine=params["model_engine"],
-                                       temperature=params["temperature"],
-                                       top_p=params["top_p"],
-                                       user_id=message.author.id)
-
-    response = ping + response if ping else response
-
-    await reply_split(message, response, image)
+    return messages_prompt
 
 
-def get_author_information(author_ids, guild):
+async def get_author_information(author_ids, guild):
     print(f"Author IDs: {author_ids}")
     authors_information = {}
-    for author in author_ids:
-        name = get_name(int(author))
-        if name:
-            description = get_description(int(author))
-            authors_information[author] = (name, description)
+    # author_ids repeats every author once per message; resolve the distinct ones in one lookup
+    authors = list(dict.fromkeys(author_ids))
+    identities = await aget_identities([int(author) for author in authors])
+    new_names = {}
+    for author in authors:
+        identity = identities[int(author)]
+        if identity and identity[0]:
+            authors_information[author] = identity
         else:
             member = guild.get_member(author)
             if member:
                 name = member.nick or member.display_name
-                set_name(author, name)
+                new_names[int(author)] = name
                 authors_information[author] = (name, "")
             else:
                 logger.warning(f"Could not find member for user ID {author} in guild {guild.id}")
                 authors_information[author] = (str(author), "")
+    if new_names:
+        await aset_names(new_names)
     return authors_information
@@ -0,0 +1,26 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    """
+    A fresh database at a temporary DB_PATH. The writer and reader pools are replaced too,
+    because their threads keep connections to whatever database they opened first.
+    """
+    db.close_connections()
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "bot.db"))
+    monkeypatch.setattr(db, "_writer", ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer"))
+    monkeypatch.setattr(db, "_readers", ThreadPoolExecutor(max_workers=db.READER_THREADS, thread_name_prefix="db-reader"))
+    db.identity_cache.invalidate()
+    db.karma_cache.invalidate()
+    db.init_db(1)
+    yield db
+    db.shutdown()
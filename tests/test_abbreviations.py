@@ -0,0 +1,16 @@
+import asyncio
+
+
+def test_abbreviations_are_cached_until_changed(temp_db):
+    temp_db.set_abbreviation(1, 2, "brb", "be right back")
+    assert temp_db.get_all_abbreviations(1, 2) == {"brb": "be right back"}
+    misses = temp_db.abbreviation_cache.misses
+
+    assert asyncio.run(temp_db.aget_all_abbreviations(1, 2)) == {"brb": "be right back"}
+    assert temp_db.abbreviation_cache.misses == misses
+
+    temp_db.set_abbreviation(1, 2, "afk", "away from keyboard")
+    assert temp_db.get_all_abbreviations(1, 2) == {"brb": "be right back", "afk": "away from keyboard"}
+
+    temp_db.delete_abbreviation(1, 2, "brb")
+    assert temp_db.get_all_abbreviations(1, 2) == {"afk": "away from keyboard"}
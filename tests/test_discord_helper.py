@@ -0,0 +1,180 @@
+import asyncio
+import datetime
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+import discord_helper
+
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    stores = (discord_helper.message_index, discord_helper.cache, discord_helper.fetched,
+              discord_helper.missing, discord_helper._inflight)
+    for store in stores:
+        store.clear()
+    yield
+    for store in stores:
+        store.clear()
+
+
+class FakeMessage(SimpleNamespace):
+    pass
+
+
+def fake_message(message_id, channel, reference=None):
+    return FakeMessage(
+        id=message_id, author=SimpleNamespace(id=7, bot=False), content="hello",
+        created_at=datetime.datetime.now(datetime.timezone.utc), reference=reference,
+        attachments=[], embeds=[], channel=channel, guild=None)
+
+
+def reply_to(message_id, channel_id):
+    return SimpleNamespace(message_id=message_id, channel_id=channel_id, guild_id=None, resolved=None)
+
+
+class FakeChannel:
+    def __init__(self, existing, channel_id=1):
+        self.id = channel_id
+        # message id -> its reference, or None
+        self.existing = existing if isinstance(existing, dict) else dict.fromkeys(existing)
+        self.fetches = 0
+
+    async def fetch_message(self, message_id):
+        self.fetches += 1
+        # stay in flight long enough for every other lookup to join
+        await asyncio.sleep(0.01)
+        if message_id not in self.existing:
+            raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown Message")
+        return fake_message(message_id, self, self.existing[message_id])
+
+
+class FakeBot:
+    def __init__(self, *channels):
+        self.channels = {channel.id: channel for channel in channels}
+
+    def get_partial_messageable(self, channel_id, guild_id=None):
+        return self.channels[channel_id]
+
+
+def test_concurrent_lookups_share_one_fetch():
+    channel = FakeChannel({42})
+
+    async def lookup():
+        return await asyncio.gather(*(discord_helper.get_msg(None, channel, 42) for _ in range(100)))
+
+    messages = asyncio.run(lookup())
+
+    assert channel.fetches == 1
+    assert all(msg is not None and msg.id == 42 for msg in messages)
+
+
+def test_repeated_lookups_reuse_the_fetched_message():
+    channel = FakeChannel({42})
+
+    async def lookup():
+        return [await discord_helper.get_msg(None, channel, 42) for _ in range(5)]
+
+    messages = asyncio.run(lookup())
+
+    assert channel.fetches == 1
+    assert all(msg is messages[0] for msg in messages)
+
+
+def test_not_found_is_remembered():
+    channel = FakeChannel(set())
+
+    async def lookup():
+        first = await asyncio.gather(*(discord_helper.get_msg(None, channel, 13) for _ in range(100)))
+        second = await discord_helper.get_record(None, channel, 13)
+        return first, second
+
+    first, second = asyncio.run(lookup())
+
+    assert first == [None] * 100
+    assert second is None
+    assert channel.fetches == 1
+    assert discord_helper.is_missing(13)
+
+
+def test_reply_chain_follows_references_into_other_channels():
+    # 3 in channel 1 replies to 2 in channel 2, which replies to 1 in channel 2
+    here = FakeChannel({}, channel_id=1)
+    there = FakeChannel({2: reply_to(1, 2), 1: None}, channel_id=2)
+    start = fake_message(3, here, reply_to(2, 2))
+    # history windows are not faked; every hop falls back to fetch_message
+    there.history = None
+
+    chain = asyncio.run(discord_helper.get_reply_chain(FakeBot(here, there), start, 10))
+
+    assert [record.id for record in chain] == [3, 2, 1]
+    assert [record.channel_id for record in chain] == [1, 2, 2]
+    assert here.fetches == 0
+
+
+def test_reply_chain_uses_resolved_parents(monkeypatch):
+    # resolved parents are recognised by type
+    monkeypatch.setattr(discord, "Message", FakeMessage)
+    channel = FakeChannel({}, channel_id=1)
+    root = fake_message(1, channel)
+    middle = fake_message(2, channel, SimpleNamespace(message_id=1, channel_id=1, guild_id=None, resolved=root))
+    start = fake_message(3, channel, SimpleNamespace(message_id=2, channel_id=1, guild_id=None, resolved=middle))
+
+    chain = asyncio.run(discord_helper.get_reply_chain(FakeBot(channel), start, 10))
+
+    assert [record.id for record in chain] == [3, 2, 1]
+    assert channel.fetches == 0
+
+
+class FakeReplyTarget:
+    """
+    A message whose reply() is posted to the channel before the API response arrives.
+    """
+
+    def __init__(self, posted, latency):
+        self.posted = posted
+        self.latency = latency
+        self.content = None
+
+    async def reply(self, content, file=None):
+        sent = FakeReplyTarget(self.posted, self.latency)
+        sent.content = content
+        self.posted.append(sent)
+        await asyncio.sleep(self.latency)
+        return sent
+
+    async def edit(self, content=None, attachments=None):
+        await asyncio.sleep(self.latency)
+        self.content = content
+
+    async def delete(self):
+        self.posted.remove(self)
+
+
+def test_finish_during_first_reply_posts_one_message():
+    posted = []
+    original = FakeReplyTarget(posted, latency=0.05)
+
+    async def stream():
+        reply = discord_helper.StreamingReply(original, interval=0.01)
+        reply.feed("Hel")
+        # let the edit loop start posting the first reply
+        await asyncio.sleep(0.01)
+        return await reply.finish("Hello")
+
+    sent = asyncio.run(stream())
+
+    assert posted == sent
+    assert [message.content for message in posted] == ["Hello"]
+
+
+def test_close_stops_the_edit_loop():
+    async def stream():
+        reply = discord_helper.StreamingReply(FakeReplyTarget([], latency=0), interval=60)
+        reply.feed("partial")
+        await asyncio.sleep(0.01)
+        await asyncio.wait_for(reply.close(), timeout=1)
+        return reply._task
+
+    assert asyncio.run(stream()).done()
@@ -0,0 +1,15 @@
+from image_cache import cache_key
+
+
+def test_discord_attachment_keys_ignore_the_signature():
+    first = "https://cdn.discordapp.com/attachments/1/2/cat.png?ex=aa&is=bb&hm=cc"
+    second = "https://cdn.discordapp.com/attachments/1/2/cat.png?ex=dd&is=ee&hm=ff"
+    assert cache_key(first) == cache_key(second)
+    assert cache_key("https://media.discordapp.net/attachments/1/2/cat.png?ex=aa") == \
+        cache_key("https://media.discordapp.net/attachments/1/2/cat.png?ex=bb")
+
+
+def test_other_urls_keep_their_query():
+    assert cache_key("https://example.com/chart.png?day=1") != cache_key("https://example.com/chart.png?day=2")
+    assert cache_key("https://cdn.discordapp.com/avatars/1/a.png?size=64") != \
+        cache_key("https://cdn.discordapp.com/avatars/1/a.png?size=1024")
@@ -0,0 +1,44 @@
+import asyncio
+
+import scheduler as scheduler_module
+from scheduler import Scheduler, Every
+
+
+def test_runner_survives_database_errors(monkeypatch):
+    calls = []
+    meta = {}
+
+    async def flaky_get_meta(key):
+        await asyncio.sleep(0)
+        calls.append(key)
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+        # overdue until the first claim, then the next deadline is an interval away
+        return meta.get(key, "2000-01-01T00:00:00+00:00")
+
+    async def claim(key, expected, value):
+        await asyncio.sleep(0)
+        meta[key] = value
+        return True
+
+    monkeypatch.setattr(scheduler_module, "aget_meta", flaky_get_meta)
+    monkeypatch.setattr(scheduler_module, "acompare_and_set_meta", claim)
+    monkeypatch.setattr(scheduler_module, "RETRY_DELAY", 0)
+
+    async def main():
+        ran = asyncio.Event()
+        scheduler = Scheduler()
+
+        async def job():
+            ran.set()
+
+        scheduler.register("job", Every(60), job)
+        scheduler.start()
+        try:
+            await asyncio.wait_for(ran.wait(), timeout=5)
+        finally:
+            await scheduler.close()
+        return scheduler.jobs["job"].runs
+
+    assert asyncio.run(main()) == 1
+    assert len(calls) >= 2
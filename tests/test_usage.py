@@ -0,0 +1,50 @@
+import asyncio
+import threading
+
+# a power of two, so every partial sum is exact in floating point and the totals can be compared with ==
+DELTA = 2 ** -10
+DEBITS = 4000
+START_BANK = 10.0
+
+
+def _fund(db, user_id):
+    row = db.get_usage(user_id)
+    db.add_bank_balance(user_id, START_BANK)
+    return row["usage_balance"]
+
+
+def _assert_exact(db, user_id, allowance):
+    row = db.get_connection().execute(
+        "SELECT usage_balance, bank_balance, total_usage FROM usage WHERE user_id = ?", (user_id,)).fetchone()
+    spent = DEBITS * DELTA
+    assert row["usage_balance"] == 0
+    assert row["bank_balance"] == START_BANK - (spent - allowance)
+    assert row["total_usage"] == spent
+
+
+def test_concurrent_debits_from_threads_are_exact(temp_db):
+    allowance = _fund(temp_db, 1)
+    threads = 16
+
+    def work():
+        for _ in range(DEBITS // threads):
+            temp_db.update_usage(1, DELTA)
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    _assert_exact(temp_db, 1, allowance)
+
+
+def test_concurrent_debits_through_async_facade_are_exact(temp_db):
+    allowance = _fund(temp_db, 2)
+
+    async def debit_all():
+        await asyncio.gather(*(temp_db.aupdate_usage(2, DELTA) for _ in range(DEBITS)))
+
+    asyncio.run(debit_all())
+
+    _assert_exact(temp_db, 2, allowance)
@@ -2,10 +2,19 @@ import asyncio
 import functools
 from random import random
 
-from db import get_balance
+from config import ATTACHMENT_MAX_BYTES, ATTACHMENT_TIMEOUT, ATTACHMENT_CONCURRENCY
+from db import aget_balance
+from image_cache import image_cache, cache_key, to_data_uri
 import aiohttp
-import base64
+import logging
 import mimetypes
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# One HTTP session for downloads, so connections to the Discord CDN are reused
+_http_session = None
+_download_slots = asyncio.Semaphore(ATTACHMENT_CONCURRENCY)
 
 def truncate_long_values(obj, max_length=600):
     if isinstance(obj, dict):
@@ -16,17 +25,67 @@ def truncate_long_values(obj, max_length=600):
         return obj[:max_length] + "...[truncated]"
     return obj
 
-async def url_to_data_uri(url):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as resp:
+def get_http_session():
+    """
+    The shared aiohttp session, created on first use inside the running event loop.
+    """
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = aiohttp.ClientSession()
+    return _http_session
+
+async def close_http_session():
+    global _http_session
+    if _http_session is not None:
+        await _http_session.close()
+        _http_session = None
+
+async def download_image(url, max_bytes=ATTACHMENT_MAX_BYTES, timeout=ATTACHMENT_TIMEOUT):
+    """
+    Download url, returning (bytes, mime type). Raises on HTTP errors, timeouts, and files over max_bytes.
+    """
+    async with _download_slots:
+        async with get_http_session().get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
             resp.raise_for_status()
-            data = await resp.read()
-            mime_type = resp.headers.get("Content-Type")
+            if resp.content_length is not None and resp.content_length > max_bytes:
+                raise ValueError(f"{resp.content_length} bytes is over the {max_bytes} byte limit")
+            data = bytearray()
+            async for chunk in resp.content.iter_chunked(64 * 1024):
+                data += chunk
+                if len(data) > max_bytes:
+                    raise ValueError(f"more than the {max_bytes} byte limit")
+            mime_type = resp.headers.get("Content-Type", "").split(";")[0]
             if not mime_type:
-                ext = url.split('.')[-1]
+                ext = urlsplit(url).path.split('.')[-1]
                 mime_type = mimetypes.types_map.get(f".{ext}", "application/octet-stream")
-            b64 = base64.b64encode(data).decode("utf-8")
-            return f"data:{mime_type};base64,{b64}"
+            return bytes(data), mime_type
+
+async def url_to_data_uri(url):
+    """
+    Return url as a downscaled base64 data URI, from image_cache when this image was sent before.
+    """
+    key = cache_key(url)
+    data_uri = image_cache.get(key)
+    if data_uri is None:
+        data, mime_type = await download_image(url)
+        data_uri, prepared_size = await asyncio.to_thread(to_data_uri, data, mime_type)
+        image_cache.put(key, data_uri, len(data), prepared_size)
+    return data_uri
+
+async def urls_to_data_uris(urls):
+    """
+    Prepare every url concurrently (at most ATTACHMENT_CONCURRENCY downloads at once) and return
+    {url: data URI}. A url that fails is logged and left out rather than failing the rest.
+    """
+    urls = list(dict.fromkeys(url for url in urls if url))
+    results = await asyncio.gather(*(url_to_data_uri(url) for url in urls), return_exceptions=True)
+    data_uris = {}
+    for url, result in zip(urls, results):
+        if isinstance(result, BaseException):
+            logger.warning(f"Skipping image {url}: {type(result).__name__} {result}")
+        else:
+            data_uris[url] = result
+    return data_uris
 
 async def run_async(func, *args, **kwargs):
     loop = asyncio.get_event_loop()
@@ -39,7 +98,7 @@ def requires_credit(cost_func):
         async def wrapper(self, ctx, *args, **kwargs):
             user_id = ctx.author.id
             # Fetch user credit from DB (implement this function)
-            user_credit = get_balance(user_id)
+            user_credit = await aget_balance(user_id)
             # Estimate cost for this command
             cost = cost_func(ctx, *args, **kwargs)
             if user_credit < cost: